@@ -1,7 +1,9 @@
 import asyncio
 import logging
 import os
+import time
 import pypros
+from mailru_im_async_bot import timing
 from mailru_im_async_bot.bot import Bot
 from mailru_im_async_bot.handler import (
     CommandHandler,
@@ -13,6 +15,7 @@ from pypros.ipros import IncomingRequest
 import config
 import handlers
 from announcement_bot_inline import InlineAnnouncementBot
+from token_checker import TokenHealthChecker
 import db
 import utilities as util
 from callback import main_bot_funcs
@@ -57,48 +60,100 @@ def role_change(current, new):
         log.info(f"the role remained the same: {current}")
     else:
         if new == 'main':
+            # another instance could have changed the data while we were not main
+            util.clear_caches()
+            util.wait_user_for_state.start()
             loop.create_task(bot.start_polling())
             loop.create_task(update_bot_name(bot))
             loop.create_task(start_all())
+            token_checker.start()
         else:
+            token_checker.stop()
             loop.create_task(bot.stop_polling())
-            db.close()
+            loop.create_task(release_db())
         log.info(f"role was change from {current} to {new}")
 
 
+async def release_db():
+    # unsaved conversation state must reach tarantool before the connection is closed
+    await util.wait_user_for_state.stop()
+    await db.close()
+
+
 async def start_bot(bot_nick, bot_data=None):
-    bot_data = bot_data or util.get_bot_data(bot_nick)
+    bot_data = bot_data or await util.get_bot_data(bot_nick)
     if bot_data:
         user_id, bot_token, _, bot_name, *_ = bot_data
-        if await util.validate_token(bot_token):
+        # one /self/get both validates the token and gives the actual nick
+        bot_self = await util.get_bot_self(bot_token)
+        if bot_self:
             bot_instance = InlineAnnouncementBot(bot_token, bot_name, user_id)
+            bot_instance.bot.name = bot_self.get('nick')
+            bot_instance.bot.on_invalid_token = lambda b: token_checker.request_check(b.token)
             bot_instance.start()
-            await update_bot_name(bot_instance.bot)
             if bot_instance.is_running:
                 log.info(f"Success: {bot_name}\n")
                 inline_bots[bot_name] = bot_instance
+                token_checker.register(bot_token, bot_name)
         else:
-            db.delete(config.BOT_SPACE_NAME, (user_id, bot_token))
+            await db.delete(config.BOT_SPACE_NAME, (user_id, bot_token))
+            util.bot_cache.invalidate(bot_name)
 
 
-def stop_bot(bot_nick):
+def stop_bot(bot_nick, update_status=True):
     bot_instance = inline_bots.pop(bot_nick)
+    token_checker.unregister(bot_instance.TOKEN)
     if bot_instance.is_running:
-        bot_instance.stop()
+        bot_instance.stop(update_status)
 
 
-async def start_all():
-    log.info("\nStarting bots:\n")
-    bots = db.select(config.BOT_SPACE_NAME)
-    for bot_data in bots:
-        await start_bot(None, bot_data)
+async def remove_invalid_bot(bot_token, bot_nick):
+    bot_instance = inline_bots.get(bot_nick)
+    if bot_instance:
+        # the bots tuple is deleted below, so the status must not be written back
+        stop_bot(bot_nick, update_status=False)
+        await db.delete(config.BOT_SPACE_NAME, (bot_instance.owner_id, bot_token))
+        util.bot_cache.invalidate(bot_nick)
 
 
-def stop_all():
-    for key, bot_instance in inline_bots.items():
+token_checker = TokenHealthChecker(
+    on_invalid=remove_invalid_bot,
+    period_s=config.TOKEN_CHECK_PERIOD_S,
+    batch_size=config.TOKEN_CHECK_BATCH_SIZE,
+    batch_interval_s=config.TOKEN_CHECK_BATCH_INTERVAL_S,
+    loop=loop
+)
+
+
+async def start_all():
+    log.info("\nStarting bots:\n")
+    started = time.monotonic()
+    bots = await db.select(config.BOT_SPACE_NAME)
+    semaphore = asyncio.Semaphore(config.STARTUP_CONCURRENCY)
+
+    async def start_limited(bot_data):
+        async with semaphore:
+            await start_bot(None, bot_data)
+
+    results = await asyncio.gather(*(start_limited(bot_data) for bot_data in bots), return_exceptions=True)
+    for bot_data, result in zip(bots, results):
+        if isinstance(result, Exception):
+            log.error(f"failed to start bot {bot_data[3]}: {result!r}")
+    elapsed_ms = int((time.monotonic() - started) * 1000)
+    log.info(f"{len(inline_bots)} of {len(bots)} bots are polling in {elapsed_ms} ms")
+    timing('startup.all_bots_polling.time', elapsed_ms)
+
+
+async def stop_all():
+    for bot_nick in list(inline_bots):
+        bot_instance = inline_bots.pop(bot_nick)
+        token_checker.unregister(bot_instance.TOKEN)
         if bot_instance.is_running:
-            bot_instance.stop()
-        inline_bots.pop(key)
+            await bot_instance.close()
+    # the shared dispatch task and http session outlive the bots attached to the poller
+    if InlineAnnouncementBot.poller is not None:
+        await InlineAnnouncementBot.poller.stop()
+        InlineAnnouncementBot.poller = None
 
 
 async def update_bot_name(bot_instance: Bot):
@@ -146,6 +201,8 @@ with PidFile(config.NAME):
     finally:
         if server:
             server.close()
-        db.close()
+        loop.run_until_complete(stop_all())
+        loop.run_until_complete(release_db())
+        loop.run_until_complete(util.close_http_session())
         loop.run_until_complete(pypros.ipros.shutdown())
         loop.close()
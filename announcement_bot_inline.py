@@ -11,6 +11,7 @@ from mailru_im_async_bot.handler import (
     CommandHandler, BotButtonCommandHandler, MessageHandler
 )
 from mailru_im_async_bot.bot import Bot
+from mailru_im_async_bot.poller import Poller
 import utilities as util
 
 log = logging.getLogger(__name__)
@@ -27,18 +28,27 @@ class InlineAnnouncementBot:
     TASK_TIMEOUT_S = int(config.get("icq_bot", "task_timeout_s"))
     TASK_MAX_LEN = int(config.get("icq_bot", "task_max_len"))
     TIME_SLEEP = int(config.get("icq_bot", "time_sleep"))
+    POLL_CONNECTIONS_LIMIT = config.getint("icq_bot", "poll_connections_limit", fallback=0)
 
+    # shared by all inline bots of the process
+    poller = None
     loop = None
     bot = None
     is_running = False
     _polling_task = None
-    running_tasks = []
 
     def __init__(self, token, name, user_id, **kwargs):
         self.TOKEN = token
         self.NAME = name
         self.owner_id = user_id
         self.loop = kwargs['loop'] if 'loop' in kwargs else asyncio.get_event_loop()
+        if InlineAnnouncementBot.poller is None:
+            InlineAnnouncementBot.poller = Poller(
+                request_timeout_s=self.REQUEST_TIMEOUT_S,
+                task_max_len=self.TASK_MAX_LEN,
+                connections_limit=self.POLL_CONNECTIONS_LIMIT,
+                loop=self.loop
+            )
         self.bot = Bot(
             token=self.TOKEN,
             version=self.VERSION,
@@ -46,7 +56,8 @@ class InlineAnnouncementBot:
             poll_time_s=self.POLL_TIMEOUT_S,
             request_timeout_s=self.REQUEST_TIMEOUT_S,
             task_max_len=self.TASK_MAX_LEN,
-            task_timeout_s=self.TASK_TIMEOUT_S
+            task_timeout_s=self.TASK_TIMEOUT_S,
+            poller=InlineAnnouncementBot.poller
         )
         self.bot.dispatcher.add_handler(
             CommandHandler(callback=handlers.start_inline_message, command='start')
@@ -73,38 +84,39 @@ class InlineAnnouncementBot:
     def start(self):
         log.info(f'\nStart inline bot @{self.NAME}')
         self._polling_task = self.loop.create_task(self.bot.start_polling())
-        self.running_tasks.append(self.loop.create_task(self._run_tasks()))
-        self.update_status_bot(False)
+        self.loop.create_task(self.update_status_bot(False))
         self.is_running = True
 
-    def stop(self):
-        log.info('\nStop inline bot @{self.NAME}')
+    def stop(self, update_status=True):
+        log.info(f'\nStop inline bot @{self.NAME}')
         if isinstance(self._polling_task, Task):
             self._polling_task.cancel()
-        for task in self.running_tasks:
-            task.cancel()
+        self.loop.create_task(self.bot.stop_polling())
         self._polling_task = None
-        self.update_status_bot(False)
+        if update_status:
+            self.loop.create_task(self.update_status_bot(False))
         self.is_running = False
 
-    def update_status_bot(self, status: bool) -> None:
+    async def close(self):
+        """
+        Останавливает бота при завершении процесса, дожидаясь остановки поллинга
+        :return: None
+        """
+        log.info(f'\nClose inline bot @{self.NAME}')
+        if isinstance(self._polling_task, Task):
+            self._polling_task.cancel()
+        self._polling_task = None
+        self.is_running = False
+        await self.bot.stop()
+
+    async def update_status_bot(self, status: bool) -> None:
         """
         Обновляет статус бота
         :param status: Новый статус для бота
         :return: None
         """
-        bot_data = util.get_bot_data(self.NAME)
-        bot_data[4] = status
-        db.replace(BOT_SPACE_NAME, bot_data)
-
-    async def check_token(self):
-        if not await util.validate_token(self.TOKEN):
-            db.delete(config.BOT_SPACE_NAME, (self.owner_id, self.TOKEN))
-
-    async def _run_tasks(self):
-        while self.is_running:
-            try:
-                await self.check_token()
-                await asyncio.sleep(30)
-            except Exception as e:
-                log.exception(e)
+        bot_data = await util.get_bot_data(self.NAME)
+        if bot_data:
+            bot_data[4] = status
+            await db.replace(BOT_SPACE_NAME, bot_data)
+            util.bot_cache.invalidate(self.NAME)
@@ -0,0 +1,79 @@
+"""
+Event loop stall and throughput of tarantool selects: the blocking tarantool client
+against the pipelined aiotarantool client used by db.py.
+
+Needs a running tarantool with the bots space, e.g. `tarantool scheme/all.lua`:
+    python benchmarks/db_pipeline.py --host 127.0.0.1 --port 3303 --requests 10000
+"""
+import argparse
+import asyncio
+import time
+
+import aiotarantool
+import tarantool
+
+SPACE_NAME = 'bots'
+
+
+async def watch_loop(lags, interval_s=0.001):
+    # the longest time the loop could not run this task is the worst stall a handler sees
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval_s)
+        lags.append(time.perf_counter() - started - interval_s)
+
+
+async def run_blocking(host, port, requests, concurrency):
+    conn = tarantool.connect(host, port)
+
+    async def worker(n):
+        for _ in range(n):
+            conn.select(SPACE_NAME, None, limit=1)
+            await asyncio.sleep(0)
+
+    try:
+        await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    finally:
+        conn.close()
+
+
+async def run_pipelined(host, port, requests, concurrency):
+    conn = aiotarantool.connect(host, port)
+
+    async def worker(n):
+        for _ in range(n):
+            await conn.select(SPACE_NAME, None, limit=1)
+
+    try:
+        await asyncio.gather(*(worker(requests // concurrency) for _ in range(concurrency)))
+    finally:
+        await conn.close()
+
+
+async def measure(name, run, args):
+    lags = []
+    watcher = asyncio.ensure_future(watch_loop(lags))
+    started = time.perf_counter()
+    await run(args.host, args.port, args.requests, args.concurrency)
+    elapsed = time.perf_counter() - started
+    watcher.cancel()
+    lags.sort()
+    p99 = lags[int(len(lags) * 0.99)] if lags else elapsed
+    print(f"{name:>10}: {args.requests / elapsed:8.0f} req/s, "
+          f"loop stall p99 {p99 * 1000:.2f} ms, max {(lags[-1] if lags else elapsed) * 1000:.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3303)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(measure('blocking', run_blocking, args))
+    loop.run_until_complete(measure('pipelined', run_pipelined, args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import time
+import logging
+from collections import OrderedDict
+
+from mailru_im_async_bot import stat
+
+log = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Bounded in-process cache with per-entry TTL and LRU eviction.
+    Hits and misses are reported as cache.<name>.hit.cnt / cache.<name>.miss.cnt
+    """
+
+    def __init__(self, name, max_len=10000, ttl_s=60):
+        self.name = name
+        self.max_len = max_len
+        self.ttl_s = ttl_s
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                stat(f"cache.{self.name}.hit.cnt", 1)
+                return value
+            del self._data[key]
+        stat(f"cache.{self.name}.miss.cnt", 1)
+        return default
+
+    def put(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl_s, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_len:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        for key in [k for k, (_, v) in self._data.items() if predicate(k, v)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 from tarantool.error import DatabaseError
@@ -8,6 +9,7 @@ from config import (
     ADMIN_SPACE_NAME,
     LINK_ICQ
 )
+from mailru_im_async_bot import stat, measure
 from response import start_message_inline_bot
 import db
 import utilities as util
@@ -22,104 +24,68 @@ class UserEvent:
     @classmethod
     async def init(cls, bot, event, *args, **kwargs):
         self = UserEvent()
+        # passed to db and utilities calls as cache=..., so it never outlives the event
+        self.cache = db.RequestCache()
         self.bot = bot
         self.event = event
         self.event_type = event.type.value
-        self.user_id = event.data['from']['userId']
-        msg_data = self._get_message_data()
-        self.message_id = msg_data['id']
-        self.message_text = msg_data['text']
-        self.parts = msg_data['parts']
-        self.chat_id = msg_data['chat_id']
-        self.command = msg_data['command']
-        self.command_args = msg_data['command_args']
-        self.keyboard = []
-        self.mentions = []
-        self.forwards = []
-        self.files = []
-        self._parse_parts()
-        self.query_id = self._get_query_id()
-        self.callback_data = event.data['callbackData'] if 'callbackData' in event.data else ''
-        cb_data = self._process_callback_name()
+        self.user_id = event.user_id
+        self.message_id = event.msg_id
+        self.message_text = event.text
+        self.parts = event.parts
+        self.chat_id = event.chat_id
+        self.command = event.command
+        self.command_args = event.args
+        self.keyboard = event.keyboard
+        self.mentions = event.mentions
+        self.forwards = event.forwards
+        self.files = event.files
+        self.query_id = event.query_id
+        self.callback_data = event.callback_data
+        cb_data = util.parse_callback_name(self.callback_data)
         self.callback_name = cb_data['callback']
         self.callback_params = cb_data['params']
-        wait_user_for = self._get_user_for()
+        wait_user_for = await self._get_user_for()
         self.wait_user_for = wait_user_for['action']
         self.wait_user_for_params = wait_user_for['params']
         self.args = args
         self.kwargs = kwargs
         return self
 
-    def _get_user_for(self):
+    async def _get_user_for(self):
         action = None
         params = None
-        wait_user_for = db.select('wait_user_for', self.user_id)
-        if wait_user_for:
-            params = wait_user_for[0][1].split(';')
+        wait_user_for = await util.wait_user_for_state.pop(self.user_id)
+        if wait_user_for is not None:
+            params = wait_user_for.split(';')
             action = params.pop(0)
-            db.delete('wait_user_for', self.user_id)
         return {'action': action, 'params': params}
 
-    def _process_callback_name(self):
-        parts = self.callback_data.split(';')
-        return {
-            'callback': parts.pop(0),
-            'params': parts
-        }
-
-    def _get_message_data(self):
-        msg_data = self.event.data
-        command = None
-        command_args = []
-        if self.event_type == 'callbackQuery':
-            msg_data = self.event.data['message']
-        text = msg_data['text'] if 'text' in msg_data else ''
-        msg_id = msg_data['msgId']
-        parts = msg_data['parts'] if 'parts' in msg_data else []
-        chat_id = msg_data['chat']['chatId']
-        if self.event_type == 'newMessage':
-            command, command_args = self._parse_command(text)
-        return {'id': msg_id,
-                'text': text,
-                'parts': parts,
-                'chat_id': chat_id,
-                'command': command,
-                'command_args': command_args}
-
-    def _get_query_id(self):
-        return self.event.data['queryId'] if self.event_type == 'callbackQuery' else None
-
-    def _parse_parts(self):
-        for part in self.parts:
-            if part['type'] == 'inlineKeyboardMarkup':
-                self.keyboard.extend(part['payload'])
-            elif part['type'] == 'mention':
-                self.mentions.append(part['payload'])
-            elif part['type'] == 'forward':
-                self.forwards.append(part['payload'])
-            elif part['type'] == 'file':
-                self.files.append(part['payload'])
-
-    def _parse_command(self, text):
-        text = text.strip(' ')
-        command = None
-        args = []
-        if text.startswith('/'):
-            parts = text.split(' ')
-            if parts:
-                command = parts.pop(0).lstrip('/')
-                args = list(filter(len, parts))
-        return [command, args]
-
 
 class CallbackProcessor:
 
     async def __call__(self, cb_event: UserEvent, **kwargs):
+        route = CALLBACK_ROUTES.get(cb_event.callback_name)
+        if route is None:
+            log.warning(f"unknown callback route '{cb_event.callback_name}'")
+            stat('callback_route.unknown.cnt', 1)
+            return await self.set_null_callback(cb_event)
+        if not route.accepts(cb_event.callback_params):
+            log.warning(f"callback route '{route.name}' got wrong params {cb_event.callback_params}")
+            stat(f'callback_route.{route.name}.bad_params.cnt', 1)
+            return await self.set_null_callback(cb_event)
+        stat(f'callback_route.{route.name}.cnt', 1)
         try:
-            coro = await getattr(CallbackProcessor, cb_event.callback_name)(cb_event)
-            await self.set_null_callback(cb_event) if not coro else await coro
-        except AttributeError as e:
-            log.error(e)
+            with measure(f'callback_route.{route.name}.time'):
+                coro = await route.handler(cb_event)
+                await self.set_null_callback(cb_event) if not coro else await coro
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception(f"callback route '{route.name}' failed")
+            stat(f'callback_route.{route.name}.error.cnt', 1)
+            # stop the button spinning
+            await self.set_null_callback(cb_event)
 
     @staticmethod
     async def set_null_callback(cb_event):
@@ -139,6 +105,22 @@ class CallbackProcessor:
                 show_alert=False
             )
 
+    @staticmethod
+    async def notify_admins(cb_event, metric, **kwargs):
+        """
+        Отправляет сообщение всем админам бота, кроме автора события
+        :param metric: Имя рассылки для статистики
+        :param kwargs: Параметры bot.send_text
+        :return: None
+        """
+        admins = await util.get_admin_uids(cb_event.bot.name, cache=cb_event.cache)
+        admins = [a for a in admins if a != cb_event.user_id]
+        await util.fan_out(
+            admins,
+            lambda admin: cb_event.bot.send_text(chat_id=admin, **kwargs),
+            metric=metric
+        )
+
     @staticmethod
     async def instruction(cb_event):
         await cb_event.bot.send_text(
@@ -168,11 +150,11 @@ class CallbackProcessor:
     async def connect_bot(cb_event):
         # some dark magic from prev developer
         # needs rework but has no time
-        bot_data = db.select(USER_SPACE_NAME, cb_event.user_id)
+        bot_data = await db.select(USER_SPACE_NAME, cb_event.user_id)
         if bot_data:
-            _, bot_token, bot_id, bot_nick = db.select(USER_SPACE_NAME, cb_event.user_id)[0]
+            _, bot_token, bot_id, bot_nick = bot_data[0]
             try:
-                db.insert(BOT_SPACE_NAME, (
+                await db.insert(BOT_SPACE_NAME, (
                     cb_event.user_id,
                     bot_token,
                     bot_id,
@@ -180,10 +162,12 @@ class CallbackProcessor:
                     False,
                     start_message_inline_bot,
                     ''
-                ))
-                db.insert(ADMIN_SPACE_NAME, (
+                ), cache=cb_event.cache)
+                await db.insert(ADMIN_SPACE_NAME, (
                     cb_event.user_id, bot_nick, True, '', 0, ''
-                ))
+                ), cache=cb_event.cache)
+                util.bot_cache.invalidate(bot_nick)
+                util.admin_cache.invalidate(bot_nick)
                 await main_bot_funcs['start'](bot_nick)
                 if bot_id and bot_nick:
                     message_text = (f"Твой бот @{bot_nick} готов к работе!\n"
@@ -208,8 +192,8 @@ class CallbackProcessor:
     @staticmethod
     async def switch_inline(cb_event, new_state='enable'):
         new_bot_state = cb_event.callback_params[0] if len(cb_event.callback_params) else new_state
-        util.switch_inline_status(cb_event.bot.token, util.str_to_bool(new_bot_state))
-        is_active = util.is_bot_active(cb_event.bot.token)
+        await util.switch_inline_status(cb_event.bot.token, util.str_to_bool(new_bot_state), cache=cb_event.cache)
+        is_active = await util.is_bot_active(cb_event.bot.token, cache=cb_event.cache)
         if is_active:
             admin_message = f"Админ @[{cb_event.user_id}] включил бота"
             callback_message = "Бот включен"
@@ -241,19 +225,13 @@ class CallbackProcessor:
                 inline_keyboard_markup=json.dumps(inline_keyboard)
             )
         # send notification to other admins
-        admins = util.get_admin_uids(cb_event.bot.name)
-        admins.remove(cb_event.user_id)
-        for admin in admins:
-            await cb_event.bot.send_text(
-                chat_id=admin,
-                text=admin_message
-            )
+        await CallbackProcessor.notify_admins(cb_event, 'switch_inline', text=admin_message)
         return CallbackProcessor.set_answer_callback(cb_event, callback_message)
 
     @staticmethod
     async def check_icq_channel(cb_event):
         try:
-            icq_channel = util.get_bot_channel(cb_event.bot.name)
+            icq_channel = await util.get_bot_channel(cb_event.bot.name, cache=cb_event.cache)
             if icq_channel:
                 await cb_event.bot.send_text(
                     cb_event.user_id,
@@ -273,10 +251,10 @@ class CallbackProcessor:
 
     @staticmethod
     async def add_new_icq_channel(cb_event):
-        util.change_index_tuple_admin(cb_event.user_id, cb_event.bot.name, {
+        await util.change_index_tuple_admin(cb_event.user_id, cb_event.bot.name, {
             '3': "set_icq_channel",
             "4": 1
-        })
+        }, cache=cb_event.cache)
         await cb_event.bot.send_text(
             cb_event.user_id,
             text=(
@@ -345,9 +323,10 @@ class CallbackProcessor:
         if cb_event.mentions:
             for mention in cb_event.mentions:
                 try:
-                    db.insert(ADMIN_SPACE_NAME, (
+                    await db.insert(ADMIN_SPACE_NAME, (
                         mention['userId'], cb_event.bot.name, True, '', 0, ''
-                    ))
+                    ), cache=cb_event.cache)
+                    util.admin_cache.invalidate(cb_event.bot.name)
                     await cb_event.bot.send_text(
                         cb_event.user_id,
                         text=(
@@ -380,7 +359,7 @@ class CallbackProcessor:
         ]
         admin_list_text = "Администраторы:\n"
         admin_list_index = 1
-        admins = util.get_admin_uids(cb_event.bot.name)
+        admins = await util.get_admin_uids(cb_event.bot.name, cache=cb_event.cache)
         for admin in admins:
             admin_list_text += f"{admin_list_index}) @[{admin}]\n"
             admin_list_index += 1
@@ -396,7 +375,7 @@ class CallbackProcessor:
     @staticmethod
     async def remove_admin(cb_event):
         if cb_event.mentions:
-            admins = util.get_admin_uids(cb_event.bot.name)
+            admins = await util.get_admin_uids(cb_event.bot.name, cache=cb_event.cache)
             if cb_event.user_id not in admins:
                 return await cb_event.bot.send_text(
                     cb_event.user_id,
@@ -414,8 +393,9 @@ class CallbackProcessor:
                         )
                     )
                 try:
-                    if len(db.select(ADMIN_SPACE_NAME, (admin_id, cb_event.bot.name))):
-                        db.delete(ADMIN_SPACE_NAME, (admin_id, cb_event.bot.name))
+                    if len(await db.select(ADMIN_SPACE_NAME, (admin_id, cb_event.bot.name), cache=cb_event.cache)):
+                        await db.delete(ADMIN_SPACE_NAME, (admin_id, cb_event.bot.name), cache=cb_event.cache)
+                        util.admin_cache.invalidate(cb_event.bot.name)
                         await cb_event.bot.send_text(
                             cb_event.user_id,
                             text=(
@@ -435,9 +415,9 @@ class CallbackProcessor:
     @staticmethod
     async def set_channel_success(cb_event):
         try:
-            icq_channel = db.select(
-                ADMIN_SPACE_NAME, (cb_event.user_id, cb_event.bot.name)
-            )[0][5]
+            icq_channel = (await db.select(
+                ADMIN_SPACE_NAME, (cb_event.user_id, cb_event.bot.name), cache=cb_event.cache
+            ))[0][5]
             # icq_channel = util.get_bot_channel(cb_event.bot.name)
             response = await cb_event.bot.get_chat_admins(icq_channel)
             if not response.get('ok'):
@@ -454,11 +434,12 @@ class CallbackProcessor:
                     inline_keyboard_markup=json.dumps(inline_keyboard)
                 )
             else:
-                util.set_null_admin_tuple(cb_event.user_id, cb_event.bot.name)
-                bot_info = util.get_bot_data(cb_event.bot.name)
+                await util.set_null_admin_tuple(cb_event.user_id, cb_event.bot.name, cache=cb_event.cache)
+                bot_info = await util.get_bot_data(cb_event.bot.name, cache=cb_event.cache)
                 if bot_info:
                     bot_info[6] = icq_channel
-                    db.replace(BOT_SPACE_NAME, bot_info)
+                    await db.replace(BOT_SPACE_NAME, bot_info, cache=cb_event.cache)
+                    util.bot_cache.invalidate(cb_event.bot.name)
                     inline_keyboard = [
                         [{"text": "Назад", "callbackData": "start_inline_message"}],
                     ]
@@ -476,11 +457,11 @@ class CallbackProcessor:
 
     @staticmethod
     async def send_post(cb_event):
-        if util.is_admin(cb_event.user_id, cb_event.bot.name):
-            icq_channel = util.get_bot_channel(cb_event.bot.name)
+        if await util.is_admin(cb_event.user_id, cb_event.bot.name, cache=cb_event.cache):
+            icq_channel = await util.get_bot_channel(cb_event.bot.name, cache=cb_event.cache)
             response = await cb_event.bot.get_chat_admins(icq_channel)
             if not response.get('ok'):
-                util.set_bot_channel(cb_event.user_id, cb_event.bot.token)
+                await util.set_bot_channel(cb_event.user_id, cb_event.bot.token, cache=cb_event.cache)
                 await cb_event.bot.send_text(
                     chat_id=cb_event.user_id,
                     text="⚠️ Чтобы в группу или канал начали публиковаться объявления,"
@@ -492,7 +473,7 @@ class CallbackProcessor:
             else:
                 original_msg_id = cb_event.callback_params[0]
                 try:
-                    message_data = db.select('messages', original_msg_id)
+                    message_data = await db.select('messages', original_msg_id)
                     if message_data:
                         msg_id, msg_text, msg_sender, msg_reply, msg_controls, *_ = message_data[0]
                         # send original text to target channel
@@ -502,18 +483,15 @@ class CallbackProcessor:
                         )
                         if target_msg.get('ok'):
                             msg_posted = target_msg['msgId']
-                            db.update('messages', msg_id, (('=', 5, msg_posted), ('=', 6, icq_channel)))
+                            await db.update('messages', msg_id, (('=', 5, msg_posted), ('=', 6, icq_channel)))
 
                             # forward original message to admins
-                            admins = util.get_admin_uids(cb_event.bot.name)
-                            admins.remove(cb_event.user_id)
-                            for admin in admins:
-                                await cb_event.bot.send_text(
-                                    chat_id=admin,
-                                    text=f"Админ @[{cb_event.user_id}] опубликовал объявление",
-                                    forward_chat_id=msg_sender,
-                                    forward_msg_id=msg_id
-                                )
+                            await CallbackProcessor.notify_admins(
+                                cb_event, 'send_post',
+                                text=f"Админ @[{cb_event.user_id}] опубликовал объявление",
+                                forward_chat_id=msg_sender,
+                                forward_msg_id=msg_id
+                            )
 
                             # edit controls message
                             inline_keyboard = [
@@ -538,7 +516,7 @@ class CallbackProcessor:
     async def delete_post(cb_event):
         original_msg_id = cb_event.callback_params[0]
         try:
-            message_data = db.select('messages', original_msg_id)
+            message_data = await db.select('messages', original_msg_id)
             if message_data:
                 msg_id, msg_text, msg_sender, msg_reply, msg_controls, *_ = message_data[0]
                 await cb_event.bot.delete_messages(
@@ -555,9 +533,9 @@ class CallbackProcessor:
     @staticmethod
     async def delete_fwd(cb_event):
         try:
-            icq_channel = util.get_bot_channel(cb_event.bot.name)
+            icq_channel = await util.get_bot_channel(cb_event.bot.name, cache=cb_event.cache)
             post_id = cb_event.callback_params[0]
-            message_data = db.select('messages', post_id)
+            message_data = await db.select('messages', post_id)
             if message_data:
                 message = message_data[0]
                 # delete forwarded message
@@ -573,14 +551,11 @@ class CallbackProcessor:
                 )
 
                 # forward notification to admins
-                admins = util.get_admin_uids(cb_event.bot.name)
-                admins.remove(cb_event.user_id)
-                for admin in admins:
-                    await cb_event.bot.send_text(
-                        chat_id=admin,
-                        text=f"@[{cb_event.user_id}] удалил сообщение:\n"
-                             f"{message[1]}"
-                    )
+                await CallbackProcessor.notify_admins(
+                    cb_event, 'delete_fwd',
+                    text=f"@[{cb_event.user_id}] удалил сообщение:\n"
+                         f"{message[1]}"
+                )
                 # edit replied message
                 await CallbackProcessor.disable_buttons(cb_event, True, target_id=message[4])
         except IndexError as e:
@@ -621,22 +596,22 @@ class CallbackProcessor:
         if reply_msg and reply_msg.get('ok') and controls_msg.get('ok'):
             reply_id = reply_msg['msgId']
             controls_id = controls_msg['msgId']
-            db.insert('messages', (cb_event.message_id,
-                                   cb_event.message_text,
-                                   cb_event.user_id,
-                                   reply_id,
-                                   controls_id,
-                                   '',
-                                   '')
-                      )
+            await db.insert('messages', (cb_event.message_id,
+                                         cb_event.message_text,
+                                         cb_event.user_id,
+                                         reply_id,
+                                         controls_id,
+                                         '',
+                                         '')
+                            )
 
     @staticmethod
     async def update_post(cb_event):
         post_id = cb_event.callback_params[0]
         cb_id = cb_event.message_id
-        update_message_data = db.select_index('messages', post_id, 'post')
-        cb_message_data = db.select_index('messages', cb_id, 'controls')
-        icq_channel = util.get_bot_channel(cb_event.bot.name)
+        update_message_data = await db.select_index('messages', post_id, 'post')
+        cb_message_data = await db.select_index('messages', cb_id, 'controls')
+        icq_channel = await util.get_bot_channel(cb_event.bot.name, cache=cb_event.cache)
         if update_message_data and cb_message_data:
             message = update_message_data[0]
             cb_message = cb_message_data[0]
@@ -647,18 +622,15 @@ class CallbackProcessor:
                 msg_id=post_id,
                 text=new_text
             )
-            db.update('messages', message[0], (('=', 1, new_text),))
+            await db.update('messages', message[0], (('=', 1, new_text),))
 
             # forward original message to admins
-            admins = util.get_admin_uids(cb_event.bot.name)
-            admins.remove(cb_event.user_id)
-            for admin in admins:
-                await cb_event.bot.send_text(
-                    chat_id=admin,
-                    forward_chat_id=cb_event.user_id,
-                    forward_msg_id=cb_message[0],
-                    text=f"Оригинальное сообщение:\n{old_text}"
-                )
+            await CallbackProcessor.notify_admins(
+                cb_event, 'update_post',
+                forward_chat_id=cb_event.user_id,
+                forward_msg_id=cb_message[0],
+                text=f"Оригинальное сообщение:\n{old_text}"
+            )
 
             # edit replied message
             replied_id = cb_event.message_id
@@ -677,25 +649,22 @@ class CallbackProcessor:
     async def pin_msg(cb_event):
         try:
             msg_posted = cb_event.callback_params[0]
-            message_data = db.select_index('messages', msg_posted, index='post')
+            message_data = await db.select_index('messages', msg_posted, index='post')
             if message_data:
                 msg_id, msg_text, msg_sender, msg_reply, msg_controls, *_ = message_data[0]
-                icq_channel = util.get_bot_channel(cb_event.bot.name)
+                icq_channel = await util.get_bot_channel(cb_event.bot.name, cache=cb_event.cache)
                 # pin target message
                 await cb_event.bot.pin_message(
                     chat_id=icq_channel,
                     msg_id=msg_posted
                 )
                 # send notification to other admins
-                admins = util.get_admin_uids(cb_event.bot.name)
-                admins.remove(cb_event.user_id)
-                for admin in admins:
-                    await cb_event.bot.send_text(
-                        chat_id=admin,
-                        forward_chat_id=icq_channel,
-                        forward_msg_id=msg_posted,
-                        text=f"Aдмин @[{cb_event.user_id}] закрепил сообщение в чате"
-                    )
+                await CallbackProcessor.notify_admins(
+                    cb_event, 'pin_msg',
+                    forward_chat_id=icq_channel,
+                    forward_msg_id=msg_posted,
+                    text=f"Aдмин @[{cb_event.user_id}] закрепил сообщение в чате"
+                )
                 # edit controls in replied message
                 await cb_event.bot.edit_text(
                     chat_id=msg_sender,
@@ -724,7 +693,7 @@ class CallbackProcessor:
         else:
             message_text = cb_event.message_text
         message_chat_id = cb_event.user_id
-        is_fwd = is_callback or util.is_fwd_from_channel(cb_event.bot.name, cb_event.event)
+        is_fwd = is_callback or await util.is_fwd_from_channel(cb_event.bot.name, cb_event.event, cache=cb_event.cache)
         is_edit = cb_event.wait_user_for == 'edit_message'
         inline_keyboard = []
         send_button_text = "Опубликовать"
@@ -741,7 +710,7 @@ class CallbackProcessor:
             send_button_text = "Продублировать как новое"
 
         if is_edit:
-            edit_message_id = cb_event.wait_user_for_prams[0]
+            edit_message_id = cb_event.wait_user_for_params[0]
             inline_keyboard.append([{"text": "Опубликовать правки",
                                      "callbackData": f"update_post;{edit_message_id}"}])
             send_button_text = "Опубликовать как новое"
@@ -772,22 +741,22 @@ class CallbackProcessor:
         if reply_msg and reply_msg.get('ok') and controls_msg.get('ok'):
             reply_id = reply_msg['msgId']
             controls_id = controls_msg['msgId']
-            db.insert('messages', (message_id,
-                                   message_text,
-                                   cb_event.user_id,
-                                   reply_id,
-                                   controls_id,
-                                   '',
-                                   '')
-                      )
+            await db.insert('messages', (message_id,
+                                         message_text,
+                                         cb_event.user_id,
+                                         reply_id,
+                                         controls_id,
+                                         '',
+                                         '')
+                            )
 
     @staticmethod
     async def set_icq_channel(cb_event):
         try:
             channel_id = cb_event.message_text.split('icq.im/')[1]
-            util.change_index_tuple_admin(cb_event.user_id, cb_event.bot.name, {
+            await util.change_index_tuple_admin(cb_event.user_id, cb_event.bot.name, {
                 '-1': channel_id
-            })
+            }, cache=cb_event.cache)
             inline_keyboard = [
                 [{"text": "Подключить", "callbackData": "set_channel_success"}],
                 [{"text": "Отмена", "callbackData": "start_inline_message"}],
@@ -810,18 +779,14 @@ class CallbackProcessor:
         try:
             bot_name = cb_event.bot.name
             user_id = cb_event.user_id
-            is_admin = db.exist_index(
-                ADMIN_SPACE_NAME, (
-                    user_id, bot_name
-                ), index='admin_bot'
-            )
+            is_admin = await util.is_admin(user_id, bot_name, cache=cb_event.cache)
 
             if is_admin:
-                util.set_null_admin_tuple(
-                    user_id, bot_name
+                await util.set_null_admin_tuple(
+                    user_id, bot_name, cache=cb_event.cache
                 )
-                is_active = util.is_bot_active(
-                    cb_event.bot.token
+                is_active = await util.is_bot_active(
+                    cb_event.bot.token, cache=cb_event.cache
                 )
                 if is_active:
                     button = "⛔ ️Выключить"
@@ -863,3 +828,51 @@ class CallbackProcessor:
                 )
         except IndexError:
             log.error("Ошибка получения стартового сообщения встроенного бота")
+
+
+class CallbackRoute:
+    """
+    Обработчик callbackData вида name;param1;param2 и схема его параметров
+    """
+
+    def __init__(self, handler, required=0, optional=0):
+        """
+        :param handler: Метод CallbackProcessor, имя маршрута совпадает с его именем
+        :param required: Количество обязательных параметров, обработчик берет их из cb_event.callback_params
+        :param optional: Количество необязательных параметров, следуют за обязательными
+        """
+        self.handler = handler
+        self.name = handler.__name__
+        self.required = required
+        self.optional = optional
+
+    def accepts(self, params):
+        return self.required <= len(params) <= self.required + self.optional
+
+
+# callback name -> route, names come from callbackData of buttons and from wait_user_for
+CALLBACK_ROUTES = {route.name: route for route in (
+    CallbackRoute(CallbackProcessor.instruction),
+    CallbackRoute(CallbackProcessor.connect_bot),
+    CallbackRoute(CallbackProcessor.switch_inline, optional=1),
+    CallbackRoute(CallbackProcessor.check_icq_channel),
+    CallbackRoute(CallbackProcessor.add_new_icq_channel),
+    CallbackRoute(CallbackProcessor.add_icq_channel_error),
+    CallbackRoute(CallbackProcessor.config_reply),
+    CallbackRoute(CallbackProcessor.reply_add_admin),
+    CallbackRoute(CallbackProcessor.add_admin),
+    CallbackRoute(CallbackProcessor.reply_remove_admin),
+    CallbackRoute(CallbackProcessor.remove_admin),
+    CallbackRoute(CallbackProcessor.set_channel_success),
+    CallbackRoute(CallbackProcessor.send_post, required=1),
+    CallbackRoute(CallbackProcessor.delete_post, required=1),
+    CallbackRoute(CallbackProcessor.delete_fwd, required=1),
+    CallbackRoute(CallbackProcessor.edit_fwd, required=1),
+    CallbackRoute(CallbackProcessor.edit_message),
+    CallbackRoute(CallbackProcessor.update_post, required=1),
+    CallbackRoute(CallbackProcessor.pin_msg, required=1),
+    CallbackRoute(CallbackProcessor.disable_buttons, optional=1),
+    CallbackRoute(CallbackProcessor.reply_message, optional=1),
+    CallbackRoute(CallbackProcessor.set_icq_channel),
+    CallbackRoute(CallbackProcessor.start_inline_message),
+)}
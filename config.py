@@ -39,6 +39,11 @@ REQUEST_TIMEOUT_S = int(config.get("icq_bot", "request_timeout_s"))
 TASK_TIMEOUT_S = int(config.get("icq_bot", "task_timeout_s"))
 TASK_MAX_LEN = int(config.get("icq_bot", "task_max_len"))
 TIME_SLEEP = int(config.get("icq_bot", "time_sleep"))
+FAN_OUT_CONCURRENCY = config.getint("icq_bot", "fan_out_concurrency", fallback=10)
+STARTUP_CONCURRENCY = config.getint("icq_bot", "startup_concurrency", fallback=20)
+TOKEN_CHECK_PERIOD_S = config.getint("icq_bot", "token_check_period_s", fallback=TIME_SLEEP)
+TOKEN_CHECK_BATCH_SIZE = config.getint("icq_bot", "token_check_batch_size", fallback=20)
+TOKEN_CHECK_BATCH_INTERVAL_S = config.getfloat("icq_bot", "token_check_batch_interval_s", fallback=1.0)
 BOT_NAME = config.get("icq_bot", "bot_name")
 USER_SPACE_NAME = 'user'
 INLINE_USER_SETUP_SPACE_NAME = 'user_inline_setup'
@@ -47,6 +52,12 @@ BOT_SPACE_NAME = 'bots'
 ADMIN_SPACE_NAME = 'admins'
 ICQ_API = config.get("icq_bot", "api")
 LINK_ICQ = 'https://icq.im'
+CACHE_TTL_S = config.getint("cache", "ttl_s", fallback=60)
+CACHE_MAX_LEN = config.getint("cache", "max_len", fallback=10000)
+# longer than the check period, so only every third periodic check goes to the api;
+# a token reported by polling is always checked bypassing the cache
+TOKEN_CACHE_TTL_S = config.getint("cache", "token_ttl_s", fallback=3 * TOKEN_CHECK_PERIOD_S)
+WRITE_BEHIND_INTERVAL_S = config.getfloat("tarantool", "write_behind_interval_s", fallback=1.0)
 
 
 # init graphite sender
@@ -62,5 +73,7 @@ if config.getboolean('graphite', 'enable'):
         host=config.get("graphite", "server"),
         port=config.get("graphite", "port"),
         prefix=prefix,
-        timeout=2
+        timeout=2,
+        persistent=config.getboolean("graphite", "persistent", fallback=True),
+        max_batch_bytes=config.getint("graphite", "max_batch_bytes", fallback=65536)
     )
@@ -1,45 +1,107 @@
-import tarantool
-from config import config
+import aiotarantool
+from mailru_im_async_bot import measure
+from config import (
+    config,
+    ADMIN_SPACE_NAME,
+    BOT_SPACE_NAME
+)
 import logging
 
 log = logging.getLogger(__name__)
 
-__db = tarantool.connect(config.get('tarantool', 'host'), config.get('tarantool', 'port'))
+# spaces which are read several times while handling a single event
+CACHED_SPACES = (BOT_SPACE_NAME, ADMIN_SPACE_NAME, 'bot_activity')
 
+# aiotarantool keeps a single pipelined connection: requests are written
+# without waiting for previous replies and matched back by sync id
+__db = aiotarantool.connect(config.get('tarantool', 'host'), config.get('tarantool', 'port'))
 
-def insert(space_name, args) -> tuple:
-    __db.insert(space_name, args)
+
+class RequestCache:
+    """
+    Read-through cache of select results which lives for one event.
+    It is created by callback.UserEvent and passed to db calls as cache=...,
+    a write made with the cache drops everything cached for that space
+    """
+
+    def __init__(self):
+        self._spaces = {}
+
+    @staticmethod
+    def _key(key, index):
+        return index, tuple(key) if isinstance(key, (list, tuple)) else key
+
+    def get(self, space_name, key, index):
+        return self._spaces.get(space_name, {}).get(self._key(key, index))
+
+    def put(self, space_name, key, index, rows):
+        self._spaces.setdefault(space_name, {})[self._key(key, index)] = rows
+
+    def invalidate(self, space_name):
+        self._spaces.pop(space_name, None)
+
+
+async def _select(space_name, key, index=None, cache: RequestCache = None):
+    kwargs = {} if index is None else {'index': index}
+    if cache is None or space_name not in CACHED_SPACES:
+        with measure(f'tarantool.{space_name}.select.time'):
+            return await __db.select(space_name, key, **kwargs)
+    rows = cache.get(space_name, key, index)
+    if rows is None:
+        with measure(f'tarantool.{space_name}.select.time'):
+            rows = await __db.select(space_name, key, **kwargs)
+        cache.put(space_name, key, index, rows)
+    return rows
+
+
+def _invalidate(space_name, cache: RequestCache = None):
+    if cache is not None:
+        cache.invalidate(space_name)
+
+
+async def insert(space_name, args, cache: RequestCache = None) -> tuple:
+    _invalidate(space_name, cache)
+    with measure(f'tarantool.{space_name}.insert.time'):
+        await __db.insert(space_name, args)
     return args
 
 
-def replace(space_name, args) -> tuple:
-    __db.replace(space_name, args)
+async def replace(space_name, args, cache: RequestCache = None) -> tuple:
+    _invalidate(space_name, cache)
+    with measure(f'tarantool.{space_name}.replace.time'):
+        await __db.replace(space_name, args)
     return args
 
 
-def select(space_name, primary_key=None) -> list:
-    return __db.select(space_name, primary_key if primary_key else None)
+async def select(space_name, primary_key=None, cache: RequestCache = None) -> list:
+    return await _select(space_name, primary_key if primary_key else None, cache=cache)
 
 
-def delete(space_name, unique_key) -> list:
-    return __db.delete(space_name, unique_key)
+async def delete(space_name, unique_key, cache: RequestCache = None) -> list:
+    _invalidate(space_name, cache)
+    with measure(f'tarantool.{space_name}.delete.time'):
+        return await __db.delete(space_name, unique_key)
 
 
-def select_index(space_name, arg, index) -> list:
-    return __db.select(space_name, arg, index=index)
+async def select_index(space_name, arg, index, cache: RequestCache = None) -> list:
+    return await _select(space_name, arg, index=index, cache=cache)
 
 
-def exist_index(space_name, arg, index) -> bool:
-    return True if __db.select(space_name, arg, index=index) else False
+async def exist_index(space_name, arg, index, cache: RequestCache = None) -> bool:
+    return True if await _select(space_name, arg, index=index, cache=cache) else False
 
 
-def upsert(space_name, tuple_value, op_list) -> tuple:
-    return __db.upsert(space_name, tuple_value, op_list)
+async def upsert(space_name, tuple_value, op_list, cache: RequestCache = None) -> tuple:
+    _invalidate(space_name, cache)
+    with measure(f'tarantool.{space_name}.upsert.time'):
+        return await __db.upsert(space_name, tuple_value, op_list)
 
 
-def update(space_name, key, op_list) -> tuple:
-    return __db.update(space_name, key, op_list)
+async def update(space_name, key, op_list, cache: RequestCache = None) -> tuple:
+    _invalidate(space_name, cache)
+    with measure(f'tarantool.{space_name}.update.time'):
+        return await __db.update(space_name, key, op_list)
 
 
-def close():
-    return __db.close()
+async def close():
+    return await __db.close()
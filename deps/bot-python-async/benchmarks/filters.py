@@ -0,0 +1,81 @@
+"""
+Time to check a set of handler filters against a mixed stream of events:
+compiled filters sharing EventFacts of the event against a recursive walk of the same
+filter trees where every leaf derives its values from the event on its own, as before compilation.
+
+    python -m benchmarks.filters --events 20000
+"""
+import argparse
+import time
+
+from mailru_im_async_bot.event import Event, EventType
+from mailru_im_async_bot.filter import (
+    Filter, EventFacts, AndFilter, OrFilter, AllFilter, AnyFilter, InvertFilter
+)
+
+FILTERS = (
+    Filter.text_only,
+    Filter.command,
+    Filter.media,
+    Filter.data,
+    Filter.url,
+    Filter.text(['yes', 'no', 'maybe']),
+    Filter.regexp(r'^\d+$'),
+    Filter.message & ~Filter.forward,
+    Filter.callback_data('callback_start'),
+    Filter.callback_data_regexp(r'^edit_message;'),
+)
+
+PAYLOADS = (
+    (EventType.NEW_MESSAGE, {'text': 'just some text'}),
+    (EventType.NEW_MESSAGE, {'text': '/start'}),
+    (EventType.NEW_MESSAGE, {'text': 'YES'}),
+    (EventType.NEW_MESSAGE, {'text': 'https://example.com/page'}),
+    (EventType.NEW_MESSAGE, {'text': 'file', 'parts': [{'type': 'file', 'payload': {'type': 'image'}}]}),
+    (EventType.CALLBACK_QUERY, {'callbackData': 'edit_message;1'}),
+)
+
+
+def events(count):
+    for i in range(count):
+        type_, payload = PAYLOADS[i % len(PAYLOADS)]
+        yield Event(id=i, type_=type_, data=dict(payload, **{
+            'from': {'userId': 'user'}, 'chat': {'chatId': 'user', 'type': 'private'}, 'msgId': str(i)
+        }))
+
+
+def walk(filter_, event):
+    if isinstance(filter_, AndFilter):
+        return walk(filter_.filter_1, event) and walk(filter_.filter_2, event)
+    if isinstance(filter_, OrFilter):
+        return walk(filter_.filter_1, event) or walk(filter_.filter_2, event)
+    if isinstance(filter_, AllFilter):
+        return all(walk(f, event) for f in filter_.iterable)
+    if isinstance(filter_, AnyFilter):
+        return any(walk(f, event) for f in filter_.iterable)
+    if isinstance(filter_, InvertFilter):
+        return not walk(filter_.filter_, event)
+    return filter_.match(EventFacts(event))
+
+
+def measure(check, count):
+    results = []
+    started = time.perf_counter()
+    for event in events(count):
+        results.append(tuple(check(f, event) for f in FILTERS))
+    return time.perf_counter() - started, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--events', type=int, default=20000)
+    args = parser.parse_args()
+    walked_s, walked = measure(walk, args.events)
+    compiled_s, compiled = measure(lambda f, event: f(event), args.events)
+    assert walked == compiled
+    for name, elapsed in (('walk', walked_s), ('compiled', compiled_s)):
+        print(f"{name:>9}: {elapsed / args.events * 1e6:6.1f} us per event for {len(FILTERS)} filters")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Memory held by the users of a bot after one event from each of them:
+User before __slots__ and the lazy queue against the current User with eviction.
+
+    python -m benchmarks.users_memory --users 100000 --users-max-len 10000
+"""
+import argparse
+import asyncio
+import tracemalloc
+from collections import OrderedDict
+
+from mailru_im_async_bot.dispatcher import Dispatcher
+
+
+class EagerUser:
+    """ User as it was: a __dict__ and a queue allocated for every user """
+
+    def __init__(self, id, bot, task=None, parent_event_id=None):
+        self.id = id
+        self.bot = bot
+        self.task = task
+        self.parent_event_id = parent_event_id
+        self.events = asyncio.Queue(maxsize=bot.task_max_len)
+        self.handler = None
+
+
+class FakeBot:
+    def __init__(self, users_max_len):
+        self.loop = asyncio.new_event_loop()
+        self.users = OrderedDict()
+        self.task_max_len = 1000
+        self.user_ttl_s = 3600
+        self.users_max_len = users_max_len
+        self.user_queue_max_len = 1000
+
+
+def eager(users, users_max_len):
+    bot = FakeBot(users_max_len)
+    for user_id in range(users):
+        # the dispatcher looked users up with users.get(user_id, User(...)) and never removed them
+        bot.users[user_id] = bot.users.get(user_id, EagerUser(user_id, bot))
+    return bot
+
+
+def current(users, users_max_len):
+    bot = FakeBot(users_max_len)
+    dispatcher = Dispatcher(bot)
+    for user_id in range(users):
+        dispatcher._get_user(user_id)
+    return bot
+
+
+def measure(build, users, users_max_len):
+    tracemalloc.start()
+    bot = build(users, users_max_len)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    bot.loop.close()
+    return size, len(bot.users)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--users-max-len', type=int, default=10000)
+    args = parser.parse_args()
+    for name, build in (('eager', eager), ('current', current)):
+        size, kept = measure(build, args.users, args.users_max_len)
+        print(f"{name:>8}: {kept:7d} users kept, {size / 2 ** 20:7.1f} MiB, {size / kept:6.0f} B per user")
+
+
+if __name__ == '__main__':
+    main()
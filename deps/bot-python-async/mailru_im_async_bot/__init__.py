@@ -1,6 +1,8 @@
 import inspect
 import logging
+import time
 from asyncio import CancelledError
+from contextlib import contextmanager
 from functools import wraps
 from aiohttp import ContentTypeError
 
@@ -77,6 +79,34 @@ def stat(*args, **kwargs):
         graphyte.send(*args, **kwargs)
 
 
+def gauge(*args, **kwargs):
+    """
+    Current value of something, e.g. a queue size: the last value within a second is sent instead of the sum
+    """
+    if graphyte.default_sender is not None:
+        graphyte.gauge(*args, **kwargs)
+
+
+def timing(metric, value_ms):
+    """
+    Duration in milliseconds, sent as <metric>.p50.ms, <metric>.p95.ms, <metric>.p99.ms, <metric>.max.ms, <metric>.cnt
+    """
+    if graphyte.default_sender is not None:
+        graphyte.timing(metric, value_ms)
+
+
+@contextmanager
+def measure(metric):
+    """
+    Measures the block, awaits included, into timing(metric)
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing(metric, (time.perf_counter() - started) * 1000)
+
+
 def stat_decorator(*s_args, **s_kwargs):
     def call_stat(func):
         if s_args == () and s_kwargs == {}:
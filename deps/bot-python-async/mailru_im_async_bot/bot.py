@@ -1,4 +1,3 @@
-import inspect
 import json
 
 import mailru_im_async_bot
@@ -8,6 +7,8 @@ from mailru_im_async_bot import (
     try_except_request,
     log,
     stat,
+    gauge,
+    timing,
     cut_none,
     url_maker
 )
@@ -16,9 +17,11 @@ from mailru_im_async_bot.event import Event, EventType
 from mailru_im_async_bot.trace_config import trace_config
 from cached_property import cached_property
 from asyncio import CancelledError, Task
+from collections import OrderedDict
 from async_generator import asynccontextmanager
 from aiohttp import FormData, ContentTypeError
 import asyncio
+import time
 import aiohttp
 import os
 
@@ -34,32 +37,48 @@ class Bot:
             task_timeout_s=60,
             request_timeout_s=7,
             task_max_len=100000,
-            loop=None
+            loop=None,
+            poller=None,
+            dispatcher_shards=0,
+            user_ttl_s=3600,
+            users_max_len=100000,
+            user_queue_max_len=1000
     ):
         self.api_base_url = "https://api.icq.net/bot/v1" if api_url_base is None else api_url_base
         self.loop = asyncio.get_event_loop() if loop is None else loop
-        self.events = asyncio.Queue(maxsize=task_max_len)
+        self.poller = poller
+        # bots attached to a shared poller use its queue, session and dispatch task
+        self.events = asyncio.Queue(maxsize=task_max_len) if poller is None else None
         self.request_timeout_s = request_timeout_s
         self.task_timeout_s = task_timeout_s
-        self.dispatcher = Dispatcher(self)
+        self.dispatcher = Dispatcher(self, shards=dispatcher_shards)
         self.poll_time_s = poll_time_s
         self.task_max_len = task_max_len
         self.is_polling = False
         self.last_event_id = 0
         self.version = version
         self.is_running = True
-        self.users = dict()
+        # user id -> User in order of the last event, idle users are evicted by the dispatcher
+        self.users = OrderedDict()
+        self.user_ttl_s = user_ttl_s
+        self.users_max_len = users_max_len
+        self.user_queue_max_len = user_queue_max_len
         self.token = token
         self.name = name
+        # called with the bot when events/get answers "Invalid token"
+        self.on_invalid_token = None
 
         self._uin = token.split(":")[-1]
         self._dispatcher_task = None
         self._polling_task = None
-        self._session = aiohttp.ClientSession(
-            timeout=aiohttp.ClientTimeout(total=self.request_timeout_s),
-            trace_configs=[trace_config],
-            headers={'User-agent': self.user_agent}
-        )
+        if poller is None:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout_s),
+                trace_configs=[trace_config],
+                headers={'User-agent': self.user_agent}
+            )
+        else:
+            self._session = poller.session
 
     async def init(self):
         log.warning("deprecated")
@@ -68,7 +87,8 @@ class Bot:
         log.info('stop bot')
         self.is_running = False
         await self.stop_polling()
-        await self._session.close()
+        if self.poller is None:
+            await self._session.close()
 
     @try_except_request
     @cut_none_decorator
@@ -85,28 +105,28 @@ class Bot:
             return await response.json()
 
     @asynccontextmanager
-    async def _request_cm(self, url, method="GET", *args, **kwargs):
+    async def _request_cm(self, url, method="GET", metric_name=None, *args, **kwargs):
+        # metric_name is declared by every api method and gives botapi.<metric_name>.* stats
         kwargs = cut_none(kwargs)
         url = url_maker(kwargs, url)
-        caller_method_name = None
-        try:
-            caller_method_name = inspect.stack()[2][3]
-        except IndexError as e:
-            log.info(e)
+        if self.poller is not None:
+            # shared session has no per bot headers
+            kwargs.setdefault('headers', {'User-agent': self.user_agent})
 
-        if caller_method_name:
-            stat(metric=".".join(["botapi", caller_method_name, "cnt"]), value=1)
+        if metric_name:
+            stat(metric=".".join(["botapi", metric_name, "cnt"]), value=1)
 
+        started = time.perf_counter()
         try:
             async with getattr(self._session, str(method).lower())(url, ssl=False, *args, **kwargs) as response:
-                if caller_method_name:
+                if metric_name:
                     stat(metric=".".join(
-                        ["botapi", caller_method_name, response.method, str(response.status), "cnt"]
+                        ["botapi", metric_name, response.method, str(response.status), "cnt"]
                     ), value=1)
                 yield response
         except asyncio.TimeoutError as e:
-            if caller_method_name:
-                stat(metric=".".join(["botapi", caller_method_name, response.method, "timeout", "cnt"]), value=1)
+            if metric_name:
+                stat(metric=".".join(["botapi", metric_name, str(method).upper(), "timeout", "cnt"]), value=1)
             raise
         except ContentTypeError as e:
             log.warning(f"response is not json: {e}")
@@ -114,10 +134,13 @@ class Bot:
         except CancelledError as e:
             log.info(f"request cancelled: {e}")
         except Exception as e:
-            if caller_method_name:
-                stat(metric=".".join(["botapi", caller_method_name, response.method, "error", "cnt"]), value=1)
+            if metric_name:
+                stat(metric=".".join(["botapi", metric_name, str(method).upper(), "error", "cnt"]), value=1)
             log.exception(e)
             raise
+        finally:
+            if metric_name:
+                timing(".".join(["botapi", metric_name, "time"]), (time.perf_counter() - started) * 1000)
 
     async def start_polling(self):
         for item, message in (
@@ -132,15 +155,21 @@ class Bot:
             log.info('start polling')
             self.is_polling = True
             self._polling_task = self.loop.create_task(self._polling())
-            self._dispatcher_task = self.loop.create_task(self.dispatcher.dispatch())
+            if self.poller is None:
+                self._dispatcher_task = self.loop.create_task(self.dispatcher.dispatch())
+            else:
+                self.poller.attach(self)
 
     async def stop_polling(self):
         log.info('stop polling')
         self.is_polling = False
+        if self.poller is not None:
+            self.poller.detach(self)
         if isinstance(self._polling_task, Task):
             self._polling_task.cancel()
         if isinstance(self._dispatcher_task, Task):
             self._dispatcher_task.cancel()
+        self.dispatcher.stop()
         self._polling_task = None
         self._dispatcher_task = None
 
@@ -150,23 +179,33 @@ class Bot:
                 response = await self.events_get()
                 if response:
                     if "description" in response and response["description"] == 'Invalid token':
+                        if self.on_invalid_token:
+                            self.on_invalid_token(self)
                         raise Exception(response)
+                    events = self.events if self.poller is None else self.poller.events
                     for event in response.get("events", []):
-                        stat('events_queue.cnt', self.events.qsize())
-                        if self.events.full():
+                        gauge('events_queue.cnt', events.qsize())
+                        if events.full():
                             log.critical("events queue overflow")
                             await asyncio.sleep(1)
                         else:
                             self.last_event_id = max(response['events'], key=lambda e: e['eventId'])['eventId']
-                            await self.events.put(
-                                Event(id=event['eventId'], type_=EventType(event["type"]), data=event["payload"])
-                            )
+                            await self.put_event(Event(
+                                id=event['eventId'], type_=EventType(event["type"]), data=event["payload"],
+                                received_at=time.perf_counter()
+                            ))
             except CancelledError:
                 log.warning("pooling cancelled")
             except Exception as e:
                 log.exception(e)
                 await asyncio.sleep(5)
 
+    async def put_event(self, event):
+        if self.poller is None:
+            await self.events.put(event)
+        else:
+            await self.poller.put(self, event)
+
     async def idle(self):
         while self.is_running:
             await asyncio.sleep(0.1)
@@ -190,6 +229,7 @@ class Bot:
 
         async with self._request_cm(
             url="{}/events/get".format(self.api_base_url),
+            metric_name="events_get",
             params={
                 "token": self.token,
                 "pollTime": poll_time_s,
@@ -202,6 +242,7 @@ class Bot:
     async def self_get(self):
         async with self._request_cm(
             url="{}/self/get".format(self.api_base_url),
+            metric_name="self_get",
             params={
                 "token": self.token
             }
@@ -221,6 +262,7 @@ class Bot:
 
         async with self._request_cm(
             url="{}/messages/sendText".format(self.api_base_url),
+            metric_name="send_text",
             params=params
         ) as response:
             return await response.json()
@@ -243,6 +285,7 @@ class Bot:
 
         async with self._request_cm(
             url="{}/messages/sendFile".format(self.api_base_url),
+            metric_name="send_file",
             method="POST",
             params=params,
             data=data,
@@ -267,6 +310,7 @@ class Bot:
 
         async with self._request_cm(
             url="{}/messages/sendVoice".format(self.api_base_url),
+            metric_name="send_voice",
             method="POST",
             params=params,
             data=data,
@@ -276,6 +320,7 @@ class Bot:
     async def edit_text(self, chat_id, msg_id, text, inline_keyboard_markup=None):
         async with self._request_cm(
             url="{}/messages/editText".format(self.api_base_url),
+            metric_name="edit_text",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -289,6 +334,7 @@ class Bot:
     async def answer_callback_query(self, query_id, text=None, show_alert=False, url=None):
         async with self._request_cm(
             url="{}/messages/answerCallbackQuery".format(self.api_base_url),
+            metric_name="answer_callback_query",
             params={
                 "token": self.token,
                 "queryId": query_id,
@@ -302,6 +348,7 @@ class Bot:
     async def delete_messages(self, chat_id, msg_id):
         async with self._request_cm(
             url="{}/messages/deleteMessages".format(self.api_base_url),
+            metric_name="delete_messages",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -313,6 +360,7 @@ class Bot:
     async def send_actions(self, chat_id, actions):
         async with self._request_cm(
             url="{}/chats/sendActions".format(self.api_base_url),
+            metric_name="send_actions",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -324,6 +372,7 @@ class Bot:
     async def get_chat_info(self, chat_id):
         async with self._request_cm(
             url="{}/chats/getInfo".format(self.api_base_url),
+            metric_name="get_chat_info",
             params={
                 "token": self.token,
                 "chatId": chat_id
@@ -334,6 +383,7 @@ class Bot:
     async def get_chat_admins(self, chat_id):
         async with self._request_cm(
             url="{}/chats/getAdmins".format(self.api_base_url),
+            metric_name="get_chat_admins",
             params={
                 "token": self.token,
                 "chatId": chat_id
@@ -344,6 +394,7 @@ class Bot:
     async def get_chat_members(self, chat_id, cursor=None):
         async with self._request_cm(
             url="{}/chats/getMembers".format(self.api_base_url),
+            metric_name="get_chat_members",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -355,6 +406,7 @@ class Bot:
     async def get_chat_blocked_users(self, chat_id):
         async with self._request_cm(
             url="{}/chats/getBlockedUsers".format(self.api_base_url),
+            metric_name="get_chat_blocked_users",
             params={
                 "token": self.token,
                 "chatId": chat_id
@@ -365,6 +417,7 @@ class Bot:
     async def get_chat_pending_users(self, chat_id):
         async with self._request_cm(
             url="{}/chats/getPendingUsers".format(self.api_base_url),
+            metric_name="get_chat_pending_users",
             params={
                 "token": self.token,
                 "chatId": chat_id
@@ -375,6 +428,7 @@ class Bot:
     async def chat_block_user(self, chat_id, user_id, del_last_messages=False):
         async with self._request_cm(
             url="{}/chats/blockUser".format(self.api_base_url),
+            metric_name="chat_block_user",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -387,6 +441,7 @@ class Bot:
     async def chat_unblock_user(self, chat_id, user_id):
         async with self._request_cm(
             url="{}/chats/unblockUser".format(self.api_base_url),
+            metric_name="chat_unblock_user",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -398,6 +453,7 @@ class Bot:
     async def chat_resolve_pending(self, chat_id, approve=True, user_id="", everyone=False):
         async with self._request_cm(
             url="{}/chats/resolvePending".format(self.api_base_url),
+            metric_name="chat_resolve_pending",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -411,6 +467,7 @@ class Bot:
     async def set_chat_title(self, chat_id, title):
         async with self._request_cm(
             url="{}/chats/setTitle".format(self.api_base_url),
+            metric_name="set_chat_title",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -422,6 +479,7 @@ class Bot:
     async def set_chat_about(self, chat_id, about):
         async with self._request_cm(
             url="{}/chats/setAbout".format(self.api_base_url),
+            metric_name="set_chat_about",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -433,6 +491,7 @@ class Bot:
     async def set_chat_rules(self, chat_id, rules):
         async with self._request_cm(
             url="{}/chats/setRules".format(self.api_base_url),
+            metric_name="set_chat_rules",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -444,6 +503,7 @@ class Bot:
     async def get_file_info(self, file_id):
         async with self._request_cm(
             url="{}/files/getInfo".format(self.api_base_url),
+            metric_name="get_file_info",
             params={
                 "token": self.token,
                 "fileId": file_id
@@ -454,6 +514,7 @@ class Bot:
     async def pin_message(self, chat_id, msg_id):
         async with self._request_cm(
             url="{}/chats/pinMessage".format(self.api_base_url),
+            metric_name="pin_message",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -465,6 +526,7 @@ class Bot:
     async def unpin_message(self, chat_id, msg_id):
         async with self._request_cm(
             url="{}/chats/unpinMessage".format(self.api_base_url),
+            metric_name="unpin_message",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -476,6 +538,7 @@ class Bot:
     async def add_chat_members(self, chat_id, members):
         async with self._request_cm(
             url="{}/chats/members/add".format(self.api_base_url),
+            metric_name="add_chat_members",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -490,6 +553,7 @@ class Bot:
         members = [] if members is None else [members] if type(members) != list else members
         async with self._request_cm(
             url="{}/chats/createChat".format(self.api_base_url),
+            metric_name="create_chat",
             params={
                 "token": self.token,
                 "name": name,
@@ -506,6 +570,7 @@ class Bot:
     async def delete_chat_members(self, chat_id, members):
         async with self._request_cm(
             url="{}/chats/members/delete".format(self.api_base_url),
+            metric_name="delete_chat_members",
             params={
                 "token": self.token,
                 "chatId": chat_id,
@@ -1,20 +1,87 @@
 import asyncio
-from mailru_im_async_bot import log, stat
-from mailru_im_async_bot.handler import DefaultHandler
+from mailru_im_async_bot import log, gauge
+from mailru_im_async_bot.event import EventType
+from mailru_im_async_bot.handler import DefaultHandler, CommandHandler, UnknownCommandHandler
 from mailru_im_async_bot.user import User
 
 
 class Dispatcher:
-    def __init__(self, bot):
+    def __init__(self, bot, shards=0):
+        """
+        :param shards: number of per-user worker queues. 0 keeps the old mode where every handler runs in its own task.
+        With shards > 0 events of one user always go through the same worker and are handled in order,
+        while different users are handled in parallel
+        """
         self.bot = bot
         self.handlers = []
+        self.shards = shards
+        # handler tasks created by this dispatcher which are not finished yet
+        self.tasks_in_flight = 0
+
+        self._shard_queues = []
+        self._shard_workers = []
+
+        # routing index, rebuilt on the first event after handlers change
+        self._routes = None
 
     def add_handler(self, handler):
         self.handlers.append(handler)
+        self._routes = None
 
     def remove_handler(self, handler):
         if handler in self.handlers:
             self.handlers.remove(handler)
+            self._routes = None
+
+    def _build_routes(self):
+        """
+        Index handlers by event type and command name keeping their registration position,
+        so an event is checked only against handlers which can match it.
+        DefaultHandler and UnknownCommandHandler are kept aside and resolved once per event in _route
+        """
+        any_type, by_type, commands, unknown, default = [], {}, {}, [], []
+        for position, handler in enumerate(self.handlers):
+            route = (position, handler)
+            if isinstance(handler, DefaultHandler):
+                default.append(route)
+            elif isinstance(handler, UnknownCommandHandler):
+                unknown.append(route)
+            elif isinstance(handler, CommandHandler) and handler.commands:
+                for command in handler.commands:
+                    routes = commands.setdefault(command, [])
+                    # a handler registered twice still runs once per command
+                    if all(h is not handler for _, h in routes):
+                        routes.append(route)
+            elif handler.event_types is None:
+                any_type.append(route)
+            else:
+                for event_type in handler.event_types:
+                    by_type.setdefault(event_type, []).append(route)
+        self._routes = (
+            {event_type: sorted(routes + any_type) for event_type, routes in by_type.items()},
+            any_type, commands, unknown, default
+        )
+        return self._routes
+
+    def _route(self, event):
+        """
+        Handlers matching the event in registration order
+        """
+        by_type, any_type, commands, unknown, default = self._routes or self._build_routes()
+        candidates = by_type.get(event.type, any_type)
+        if commands and event.type is EventType.NEW_MESSAGE:
+            command_routes = commands.get(CommandHandler.get_command(event))
+            if command_routes:
+                candidates = sorted(candidates + command_routes)
+
+        matched = [(p, h) for p, h in candidates if h.check(event=event, dispatcher=self)]
+        if unknown and event.type is EventType.NEW_MESSAGE and not any(
+            isinstance(h, CommandHandler) for _, h in matched
+        ):
+            matched = sorted(matched + [(p, h) for p, h in unknown if h.check_own(event=event, dispatcher=self)])
+        if default and not matched:
+            matched = [(p, h) for p, h in default if h.check_own(event=event, dispatcher=self)]
+        return [h for _, h in matched]
 
     async def task_handler(self, handler, event, user):
         try:
@@ -22,7 +89,7 @@ class Dispatcher:
             await asyncio.wait_for(handler.handle(event, self, user), timeout=self.bot.task_timeout_s)
         except asyncio.TimeoutError:
             log.info("task for user[{user_id}] with eventId[{event_id}] cancelled by timeout ({s})s".format(
-                user_id=user.id, event_id=event.id, s=self.bot.task_timeout)
+                user_id=user.id, event_id=event.id, s=self.bot.task_timeout_s)
             )
         except asyncio.CancelledError:
             log.info(f"task for user[{user.id}] with eventId[{event.id}] cancelled'")
@@ -31,64 +98,154 @@ class Dispatcher:
         finally:
             log.info(f'finally task for {user}')
             user.handler = None
-            while not user.events.empty():
+            while user.has_events():
                 remaining_event = await user.events.get()
                 log.info(f'move event {remaining_event.id} from user[{user.id}] queue into bot queue')
-                await self.bot.events.put(remaining_event)
+                await self.bot.put_event(remaining_event)
+
+    def _task_started(self):
+        self.tasks_in_flight += 1
+        if self.bot.poller is not None:
+            self.bot.poller.tasks_in_flight += 1
+
+    def _task_done(self, *_):
+        self.tasks_in_flight -= 1
+        if self.bot.poller is not None:
+            self.bot.poller.tasks_in_flight -= 1
+
+    def _create_task(self, coro):
+        task = self.bot.loop.create_task(coro)
+        self._task_started()
+        task.add_done_callback(self._task_done)
+        return task
+
+    async def _handle_inline(self, handler, event):
+        self._task_started()
+        try:
+            await asyncio.wait_for(handler.handle(event, self), timeout=self.bot.task_timeout_s)
+        except asyncio.TimeoutError:
+            log.info(f"handler for eventId[{event.id}] cancelled by timeout ({self.bot.task_timeout_s})s")
+        except Exception as e:
+            log.exception(e)
+        finally:
+            self._task_done()
 
     async def dispatch(self):
         while self.bot.is_running and self.bot.is_polling:
-            task_len = len(asyncio.Task.all_tasks())
-            stat('coroutine.cnt', task_len)
+            task_len = self.tasks_in_flight
+            gauge('coroutine.cnt', task_len)
             if task_len < self.bot.task_max_len:
                 # get event from queue
                 event = await self.bot.events.get()
+                await self.submit(event)
+            else:
+                log.critical('task limit was reached: {}'.format(task_len))
+                await asyncio.sleep(1)
 
-                # prepare user data
-                user_id = event.data.get('from', {}).get('userId', None)
-                if not user_id:
-                    user_id = event.data.get('from', {}).get('chatId')
+    async def submit(self, event):
+        if not self.shards:
+            return await self.dispatch_event(event)
 
-                user = self.bot.users.get(user_id, User(user_id, self.bot))
-                self.bot.users[user_id] = user
+        if not self._shard_workers:
+            for _ in range(self.shards):
+                queue = asyncio.Queue(maxsize=self.bot.task_max_len)
+                self._shard_queues.append(queue)
+                self._shard_workers.append(self.bot.loop.create_task(self._shard_worker(queue)))
+        await self._shard_queues[hash(self._user_id(event)) % self.shards].put(event)
 
-                try:
-                    log.info(f"dispatching event[{event.id}]")
-                    processed = False
-                    for handler in (h for h in self.handlers if h.check(event=event, dispatcher=self)):
-                        log.info(f'handle event[{event.id}] by handler[{handler}]')
-                        if user.task and not user.task.done():
-                            if isinstance(handler, DefaultHandler) or [
-                                i for i in handler.ignore if i is user.handler
-                            ]:
-                                log.info(f"handler[{handler}] was cancelled because user[{user}] have active task")
-                                break
-                            else:
-                                try:
-                                    log.info(f'attempt cancel user {user_id} task')
-                                    user.handler = None
-                                    user.task.cancel()
-                                    await user.task
-                                except Exception as e:
-                                    log.info(e)
-                        if handler.multiline:
-                            user.task = self.bot.loop.create_task(self.task_handler(handler, event, user))
-                            user.parent_event_id = event.id
-                            user.handler = handler
-                        else:
-                            log.info(f'create task for user[{user}]')
-                            self.bot.loop.create_task(handler.handle(event, self))
-                        processed = True
-                    if not processed and user.task and not user.task.done():
-                        log.info(f'put event[{event.id}] into user[{user_id}] queue')
-                        await self.bot.users[user_id].events.put(event)
-                except StopDispatching:
-                    log.debug("Caught '{}' exception, stopping dispatching.".format(StopDispatching.__name__))
-                except Exception:
-                    log.exception("Exception while dispatching event!")
+    async def _shard_worker(self, queue):
+        while True:
+            event = await queue.get()
+            await self.dispatch_event(event)
+
+    def stop(self):
+        for worker in self._shard_workers:
+            worker.cancel()
+        self._shard_workers = []
+        self._shard_queues = []
+
+    @staticmethod
+    def _user_id(event):
+        return event.user_id
+
+    def _get_user(self, user_id):
+        users = self.bot.users
+        user = users.get(user_id)
+        if user is None:
+            user = users[user_id] = User(user_id, self.bot)
+        else:
+            users.move_to_end(user_id)
+        user.last_seen = self.bot.loop.time()
+        self._evict_users(keep=user)
+        return user
+
+    def _evict_users(self, keep=None):
+        """
+        Users are kept in order of the last event, so only the head of the dict has to be checked.
+        A user is removed when idle (no active task and no queued events) and either
+        not seen for user_ttl_s or the users_max_len limit is exceeded.
+        The keep user, whose event is being dispatched, is never removed
+        """
+        users = self.bot.users
+        expire_before = self.bot.loop.time() - self.bot.user_ttl_s
+        # busy users are moved to the tail, the limit keeps one call O(1) amortized
+        for _ in range(min(len(users), 16)):
+            user = next(iter(users.values()))
+            if user is keep or user.last_seen >= expire_before and len(users) <= self.bot.users_max_len:
+                break
+            if user.is_idle():
+                del users[user.id]
             else:
-                log.critical('task limit was reached: {}'.format(task_len))
-                await asyncio.sleep(1)
+                users.move_to_end(user.id)
+
+    async def dispatch_event(self, event):
+        # prepare user data
+        user_id = self._user_id(event)
+
+        user = self._get_user(user_id)
+
+        try:
+            log.info(f"dispatching event[{event.id}]")
+            processed = False
+            for handler in self._route(event):
+                log.info(f'handle event[{event.id}] by handler[{handler}]')
+                if user.task and not user.task.done():
+                    if isinstance(handler, DefaultHandler) or [
+                        i for i in handler.ignore if i is user.handler
+                    ]:
+                        log.info(f"handler[{handler}] was cancelled because user[{user}] have active task")
+                        break
+                    else:
+                        try:
+                            log.info(f'attempt cancel user {user_id} task')
+                            user.handler = None
+                            user.task.cancel()
+                            await user.task
+                        except Exception as e:
+                            log.info(e)
+                if handler.multiline:
+                    user.task = self._create_task(self.task_handler(handler, event, user))
+                    user.parent_event_id = event.id
+                    user.handler = handler
+                elif self.shards:
+                    # keeps order of the user events, multiline handlers still get their own task
+                    # since they wait for the next events of the same user
+                    log.info(f'handle event for user[{user}] in shard worker')
+                    await self._handle_inline(handler, event)
+                else:
+                    log.info(f'create task for user[{user}]')
+                    self._create_task(handler.handle(event, self))
+                processed = True
+            if not processed and user.task and not user.task.done():
+                log.info(f'put event[{event.id}] into user[{user_id}] queue')
+                try:
+                    user.events.put_nowait(event)
+                except asyncio.QueueFull:
+                    log.critical(f'user[{user_id}] queue overflow, event[{event.id}] dropped')
+        except StopDispatching:
+            log.debug("Caught '{}' exception, stopping dispatching.".format(StopDispatching.__name__))
+        except Exception:
+            log.exception("Exception while dispatching event!")
 
 
 class StopDispatching(Exception):
@@ -15,16 +15,149 @@ class EventType(Enum):
 
 
 class Event:
-    def __init__(self, id, type_, data):
+    """
+    Event of the bot api. The payload is parsed lazily on first access of a field and only once,
+    so handlers, filters and the dispatcher don't walk the raw data dict again
+    """
+
+    __slots__ = (
+        'id', 'type', 'data', 'received_at', 'filter_facts',
+        '_message', '_keyboard', '_mentions', '_forwards', '_files', '_command', '_args', '_command_key'
+    )
+
+    def __init__(self, id, type_, data, received_at=None):
 
         self.id = id
         self.type = type_
         self.data = data
+        # time.perf_counter() when the event was taken from events/get, for the end-to-end latency
+        self.received_at = received_at
+        # filter.EventFacts shared by all filters checked against the event
+        self.filter_facts = None
+
+        self._message = None
+        self._keyboard = None
+        self._mentions = None
+        self._forwards = None
+        self._files = None
+        self._command = None
+        self._args = None
+        self._command_key = None
+
+    @property
+    def sender(self):
+        return self.data.get('from', {})
+
+    # kept for backward compatibility
+    message_author = sender
+
+    @property
+    def user_id(self):
+        return self.sender.get('userId') or self.sender.get('chatId')
+
+    @property
+    def message(self):
+        """ Message payload: the event itself or the message with the button for callbackQuery """
+        if self._message is None:
+            self._message = self.data
+            if self.type is EventType.CALLBACK_QUERY:
+                self._message = self.data.get('message', {})
+        return self._message
+
+    @property
+    def chat(self):
+        return self.message.get('chat', {})
+
+    @property
+    def chat_id(self):
+        return self.chat.get('chatId')
+
+    # kept for backward compatibility
+    from_chat = chat_id
+
+    @property
+    def msg_id(self):
+        return self.message.get('msgId')
+
+    @property
+    def text(self):
+        return self.message.get('text', '')
+
+    @property
+    def parts(self):
+        return self.message.get('parts', [])
+
+    def _parse_parts(self):
+        self._keyboard, self._mentions, self._forwards, self._files = [], [], [], []
+        for part in self.parts:
+            if part['type'] == 'inlineKeyboardMarkup':
+                self._keyboard.extend(part['payload'])
+            elif part['type'] == 'mention':
+                self._mentions.append(part['payload'])
+            elif part['type'] == 'forward':
+                self._forwards.append(part['payload'])
+            elif part['type'] == 'file':
+                self._files.append(part['payload'])
+
+    @property
+    def keyboard(self):
+        if self._keyboard is None:
+            self._parse_parts()
+        return self._keyboard
+
+    @property
+    def mentions(self):
+        if self._mentions is None:
+            self._parse_parts()
+        return self._mentions
+
+    @property
+    def forwards(self):
+        if self._forwards is None:
+            self._parse_parts()
+        return self._forwards
+
+    @property
+    def files(self):
+        if self._files is None:
+            self._parse_parts()
+        return self._files
+
+    def _parse_command(self):
+        self._command, self._args = None, []
+        text = self.text.strip(' ')
+        if self.type is EventType.NEW_MESSAGE and text.startswith('/'):
+            parts = text.split(' ')
+            self._command = parts.pop(0).lstrip('/')
+            self._args = [p for p in parts if p]
+
+    @property
+    def command(self):
+        """ Command of a new message starting with '/' without the slash, None otherwise """
+        if self._args is None:
+            self._parse_command()
+        return self._command
+
+    @property
+    def args(self):
+        if self._args is None:
+            self._parse_command()
+        return self._args
+
+    @property
+    def command_key(self):
+        """ First word of the text without its prefix in lower case, what CommandHandler matches against """
+        if self._command_key is None:
+            self._command_key = self.text.partition(" ")[0][1:].lower()
+        return self._command_key
+
+    @property
+    def callback_data(self):
+        return self.data.get('callbackData', '')
 
-        if type_ == EventType.NEW_MESSAGE:
-            self.text = data.get('text', '')
-            self.from_chat = data['chat']['chatId']
-            self.message_author = data['from']
+    @property
+    def query_id(self):
+        return self.data.get('queryId') if self.type is EventType.CALLBACK_QUERY else None
 
     def __repr__(self):
         return "Event(id='{self.id}', type='{self.type}', data='{self.data}')".format(self=self)
@@ -1,16 +1,87 @@
 from mailru_im_async_bot.constant import Parts, PayLoadFileType
-from abc import ABCMeta, abstractmethod
+from abc import ABCMeta
 import six
 import re
 
 
+class EventFacts(object):
+    """
+    Per-event values shared by all filters checked against the event.
+    Each value is computed on first use, so an event pays only for what its filters look at
+    """
+
+    _NOT_SET = object()
+
+    def __init__(self, event):
+        self.event = event
+        self.data = event.data
+        text = self.data.get("text")
+        self.is_message = isinstance(text, six.string_types)
+        self.text = text if self.is_message else None
+        self._is_command = self._NOT_SET
+        self._lower_text = self._NOT_SET
+        self._part_types = self._NOT_SET
+        self._payload_types = self._NOT_SET
+
+    @classmethod
+    def of(cls, event):
+        facts = getattr(event, 'filter_facts', None)
+        if facts is None:
+            facts = cls(event)
+            try:
+                event.filter_facts = facts
+            except AttributeError:
+                pass
+        return facts
+
+    @property
+    def is_command(self):
+        if self._is_command is self._NOT_SET:
+            self._is_command = self.is_message and self.text.strip().startswith(CommandFilter.COMMAND_PREFIXES)
+        return self._is_command
+
+    @property
+    def lower_text(self):
+        if self._lower_text is self._NOT_SET:
+            self._lower_text = self.text.lower() if self.is_message else None
+        return self._lower_text
+
+    @property
+    def parts(self):
+        return self.data.get('parts', ())
+
+    @property
+    def part_types(self):
+        if self._part_types is self._NOT_SET:
+            self._part_types = frozenset(p['type'] for p in self.parts)
+        return self._part_types
+
+    @property
+    def payload_types(self):
+        if self._payload_types is self._NOT_SET:
+            self._payload_types = frozenset(
+                p['payload']['type'] for p in self.parts if 'type' in p.get('payload', ())
+            )
+        return self._payload_types
+
+
 @six.add_metaclass(ABCMeta)
 class FilterBase(object):
+    """
+    Filters are combined with &, | and ~. Calling a filter compiles the expression once into a flat evaluator
+    which shares EventFacts of the event between all leaves.
+    Subclasses implement either match(facts) or filter(event)
+    """
+
+    _compiled = None
+
     def __init__(self):
         super(FilterBase, self).__init__()
 
     def __call__(self, event):
-        return self.filter(event)
+        if self._compiled is None:
+            self._compiled = self.compile()
+        return self._compiled(EventFacts.of(event))
 
     def __and__(self, other):
         return AndFilter(self, other)
@@ -21,9 +92,61 @@ class FilterBase(object):
     def __invert__(self):
         return InvertFilter(self)
 
-    @abstractmethod
+    def compile(self):
+        """ Returns a function of EventFacts """
+        # the hook defined lowest in the hierarchy wins, so overriding filter() of a concrete filter works
+        for cls in type(self).__mro__:
+            if cls is FilterBase:
+                break
+            if 'match' in vars(cls):
+                return self.match
+            if 'filter' in vars(cls):
+                filter_ = self.filter
+                return lambda facts: filter_(facts.event)
+        raise NotImplementedError(f"{type(self).__name__} implements neither match() nor filter()")
+
+    def match(self, facts):
+        return self.compile()(facts)
+
     def filter(self, event):
-        pass
+        if type(self).match is not FilterBase.match:
+            # also what super().filter(event) gives a subclass overriding filter() of a concrete filter
+            return self.match(EventFacts.of(event))
+        return self(event)
+
+
+def _flatten(filter_, kinds):
+    if isinstance(filter_, CompositeFilter) and isinstance(filter_, kinds):
+        return _flatten(filter_.filter_1, kinds) + _flatten(filter_.filter_2, kinds)
+    if isinstance(filter_, IterableFilter) and isinstance(filter_, kinds):
+        return [leaf for f in filter_.iterable for leaf in _flatten(f, kinds)]
+    return [filter_]
+
+
+def _compile(filter_):
+    return filter_.compile() if isinstance(filter_, FilterBase) else lambda facts: filter_(facts.event)
+
+
+def _compile_all(filters):
+    evaluators = tuple(_compile(f) for f in filters)
+
+    def evaluate(facts):
+        for evaluator in evaluators:
+            if not evaluator(facts):
+                return False
+        return True
+    return evaluate
+
+
+def _compile_any(filters):
+    evaluators = tuple(_compile(f) for f in filters)
+
+    def evaluate(facts):
+        for evaluator in evaluators:
+            if evaluator(facts):
+                return True
+        return False
+    return evaluate
 
 
 class CompositeFilter(FilterBase):
@@ -35,13 +158,13 @@ class CompositeFilter(FilterBase):
 
 
 class AndFilter(CompositeFilter):
-    def filter(self, event):
-        return self.filter_1(event) and self.filter_2(event)
+    def compile(self):
+        return _compile_all(_flatten(self, (AndFilter, AllFilter)))
 
 
 class OrFilter(CompositeFilter):
-    def filter(self, event):
-        return self.filter_1(event) or self.filter_2(event)
+    def compile(self):
+        return _compile_any(_flatten(self, (OrFilter, AnyFilter)))
 
 
 class IterableFilter(FilterBase):
@@ -52,13 +175,13 @@ class IterableFilter(FilterBase):
 
 
 class AllFilter(IterableFilter):
-    def filter(self, event):
-        return all(f(event) for f in self.iterable)
+    def compile(self):
+        return _compile_all(_flatten(self, (AndFilter, AllFilter)))
 
 
 class AnyFilter(IterableFilter):
-    def filter(self, event):
-        return any(f(event) for f in self.iterable)
+    def compile(self):
+        return _compile_any(_flatten(self, (OrFilter, AnyFilter)))
 
 
 class InvertFilter(FilterBase):
@@ -67,22 +190,23 @@ class InvertFilter(FilterBase):
 
         self.filter_ = filter_
 
-    def filter(self, event):
-        return not self.filter_(event)
+    def compile(self):
+        if isinstance(self.filter_, InvertFilter):
+            return _compile(self.filter_.filter_)
+        evaluator = _compile(self.filter_)
+        return lambda facts: not evaluator(facts)
 
 
 class MessageFilter(FilterBase):
-    def filter(self, event):
-        return "text" in event.data and isinstance(event.data["text"], six.string_types)
+    def match(self, facts):
+        return facts.is_message
 
 
 class CommandFilter(MessageFilter):
     COMMAND_PREFIXES = ("/", ".")
 
-    def filter(self, event):
-        return super(CommandFilter, self).filter(event) and any(
-            event.data["text"].strip().startswith(p) for p in CommandFilter.COMMAND_PREFIXES
-        )
+    def match(self, facts):
+        return facts.is_command
 
 
 class RegexpFilter(MessageFilter):
@@ -91,8 +215,8 @@ class RegexpFilter(MessageFilter):
 
         self.pattern = re.compile(pattern) if isinstance(pattern, six.string_types) else pattern
 
-    def filter(self, event):
-        return super(RegexpFilter, self).filter(event) and self.pattern.search(event.data["text"])
+    def match(self, facts):
+        return facts.is_message and bool(self.pattern.search(facts.text))
 
 
 class SenderFilter(MessageFilter):
@@ -101,51 +225,38 @@ class SenderFilter(MessageFilter):
 
         self.user_id = user_id
 
-    def filter(self, event):
-        return super(SenderFilter, self).filter(event) and 'from' in event.data \
-               and event.data['from']['userId'] == self.user_id
+    def match(self, facts):
+        return facts.is_message and 'from' in facts.data and facts.data['from']['userId'] == self.user_id
 
 
 class FileFilter(MessageFilter):
-    def filter(self, event):
-        return super(FileFilter, self).filter(event) and 'parts' in event.data and any(
-           p['type'] == Parts.FILE.value for p in event.data['parts']
-        )
+    def match(self, facts):
+        return facts.is_message and Parts.FILE.value in facts.part_types
 
 
 class ImageFilter(FileFilter):
-    def filter(self, event):
-        return super(ImageFilter, self).filter(event) and any(
-            p['payload']['type'] == PayLoadFileType.IMAGE.value for p in event.data['parts'] if 'type' in p['payload']
-        )
+    def match(self, facts):
+        return super(ImageFilter, self).match(facts) and PayLoadFileType.IMAGE.value in facts.payload_types
 
 
 class VideoFilter(FileFilter):
-    def filter(self, event):
-        return super(VideoFilter, self).filter(event) and any(
-            p['payload']['type'] == PayLoadFileType.VIDEO.value for p in event.data['parts'] if 'type' in p['payload']
-        )
+    def match(self, facts):
+        return super(VideoFilter, self).match(facts) and PayLoadFileType.VIDEO.value in facts.payload_types
 
 
 class VoiceFilter(MessageFilter):
-    def filter(self, event):
-        return super(VoiceFilter, self).filter(event) and 'parts' in event.data and any(
-           p['type'] == Parts.VOICE.value for p in event.data['parts']
-        )
+    def match(self, facts):
+        return facts.is_message and Parts.VOICE.value in facts.part_types
 
 
 class AudioFilter(FileFilter):
-    def filter(self, event):
-        return super(AudioFilter, self).filter(event) and any(
-            p['payload']['type'] == PayLoadFileType.AUDIO.value for p in event.data['parts'] if 'type' in p['payload']
-        )
+    def match(self, facts):
+        return super(AudioFilter, self).match(facts) and PayLoadFileType.AUDIO.value in facts.payload_types
 
 
 class StickerFilter(MessageFilter):
-    def filter(self, event):
-        return super(StickerFilter, self).filter(event) and 'parts' in event.data and any(
-           p['type'] == Parts.STICKER.value for p in event.data['parts']
-        )
+    def match(self, facts):
+        return facts.is_message and Parts.STICKER.value in facts.part_types
 
 
 class MentionFilter(MessageFilter):
@@ -154,36 +265,33 @@ class MentionFilter(MessageFilter):
 
         self.user_id = user_id
 
-    def filter(self, event):
-        return super(MentionFilter, self).filter(event) and 'parts' in event.data and any(
-           p['type'] == Parts.MENTION.value and (
-               p['payload']['userId'] == self.user_id if self.user_id else True
-           ) for p in event.data['parts']
+    def match(self, facts):
+        if not facts.is_message or Parts.MENTION.value not in facts.part_types:
+            return False
+        return not self.user_id or any(
+            p['type'] == Parts.MENTION.value and p['payload']['userId'] == self.user_id for p in facts.parts
         )
 
 
 class ForwardFilter(MessageFilter):
-    def filter(self, event):
-        return 'parts' in event.data and any(p['type'] == Parts.FORWARD.value for p in event.data['parts'])
+    def match(self, facts):
+        return Parts.FORWARD.value in facts.part_types
 
 
 class ReplyFilter(MessageFilter):
-    def filter(self, event):
-        return super(ReplyFilter, self).filter(event) and 'parts' in event.data and any(
-           p['type'] == Parts.REPLY.value for p in event.data['parts']
-        )
+    def match(self, facts):
+        return facts.is_message and Parts.REPLY.value in facts.part_types
 
 
 class URLFilter(RegexpFilter):
     REGEXP = re.compile(r"^\s*https?://\S+\s*$", re.IGNORECASE)
 
-    __FILTER = InvertFilter(FileFilter())  # Files are also URLs, but we need to skip it.
-
     def __init__(self):
         super(URLFilter, self).__init__(URLFilter.REGEXP)
 
-    def filter(self, event):
-        return super(URLFilter, self).filter(event) and URLFilter.__FILTER(event)
+    def match(self, facts):
+        # Files are also URLs, but we need to skip it.
+        return super(URLFilter, self).match(facts) and Parts.FILE.value not in facts.part_types
 
 
 class TextFilter(MessageFilter):
@@ -191,16 +299,13 @@ class TextFilter(MessageFilter):
         super().__init__()
         self.text = [text] if type(text) == str else text
         self.case_sensitive = case_sensitive
+        # lower-cased once here instead of on every event
+        self._texts = frozenset(self.text if case_sensitive else (str(i).lower() for i in self.text))
 
-    def filter(self, event):
-        if super().filter(event):
-            if not self.case_sensitive:
-                self.text = [str(i).lower() for i in self.text]
-            return any(
-                i == (event.data["text"] if self.case_sensitive else str(event.data["text"]).lower())
-                for i in self.text
-            )
-        return False
+    def match(self, facts):
+        if not facts.is_message:
+            return False
+        return (facts.text if self.case_sensitive else facts.lower_text) in self._texts
 
 
 class CallbackDataFilter(FilterBase):
@@ -209,8 +314,8 @@ class CallbackDataFilter(FilterBase):
 
         self.callback_data = callback_data
 
-    def filter(self, event):
-        return 'callbackData' in event.data and event.data['callbackData'] == self.callback_data
+    def match(self, facts):
+        return 'callbackData' in facts.data and facts.data['callbackData'] == self.callback_data
 
 
 class CallbackDataRegexpFilter(FilterBase):
@@ -219,8 +324,8 @@ class CallbackDataRegexpFilter(FilterBase):
 
         self.pattern = re.compile(pattern)
 
-    def filter(self, event):
-        return 'callbackData' in event.data and self.pattern.search(event.data['callbackData'])
+    def match(self, facts):
+        return 'callbackData' in facts.data and bool(self.pattern.search(facts.data['callbackData']))
 
 
 class Filter(object):
@@ -4,17 +4,12 @@ https://gitlab.corp.mail.ru/e.sineokov/graphyte
 
 import atexit
 import logging
-from itertools import groupby
-
-try:
-    import queue
-except ImportError:
-    import Queue as queue  # Python 2.x compatibility
+import math
 import socket
 import threading
 import time
 
-__all__ = ['Sender', 'init', 'send']
+__all__ = ['Sender', 'init', 'send', 'gauge', 'timing']
 
 __version__ = '1.6.0'
 
@@ -26,13 +21,66 @@ def _has_whitespace(value):
     return not value or value.split(None, 1)[0] != value
 
 
+class Histogram:
+    """Log-bucketed histogram of millisecond values. Bucket i holds values up to
+    MIN_VALUE * RATIO ** i, so percentiles are accurate within RATIO (about 10%)
+    while an update is a log() and a dict increment.
+    """
+
+    MIN_VALUE = 0.1
+    RATIO = 1.1
+    PERCENTILES = (50, 95, 99)
+
+    _INV_LOG_RATIO = 1 / math.log(RATIO)
+
+    __slots__ = ('count', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.max = 0
+        self.buckets = {}
+
+    def add(self, value):
+        index = int(math.log(value / self.MIN_VALUE) * self._INV_LOG_RATIO) + 1 if value > self.MIN_VALUE else 0
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def percentiles(self):
+        """Return {percentile: upper bound of its bucket} capped by the max value."""
+        result = {}
+        targets = [(p, math.ceil(self.count * p / 100)) for p in self.PERCENTILES]
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            while targets and seen >= targets[0][1]:
+                result[targets.pop(0)[0]] = min(self.MIN_VALUE * self.RATIO ** index, self.max)
+            if not targets:
+                break
+        return result
+
+
 class Sender:
     def __init__(self, host, port=2003, prefix=None, timeout=5, interval=1,
-                 queue_size=None, log_sends=False, protocol='tcp', batch_size=1000):
+                 queue_size=None, log_sends=False, protocol='tcp', batch_size=1000,
+                 persistent=False, max_batch_bytes=65536, min_backoff=0.5, max_backoff=30,
+                 max_keys=100000):
         """Initialize a Sender instance, starting the background thread to
         send messages at given interval (in seconds) if "interval" is not
         None. Send at most "batch_size" messages per socket send operation (default=1000).
         Default protocol is TCP; use protocol='udp' for UDP.
+
+        In interval mode values are aggregated in place by (metric, timestamp, tags):
+        send() adds to a counter, gauge() keeps the last value. The background
+        thread sends and removes the seconds which are already over. At most
+        "max_keys" keys are kept, values for new keys above it are dropped.
+        "queue_size" is accepted for compatibility and is not used.
+
+        With persistent=True a TCP connection is kept open between sends and
+        messages are coalesced into sendall calls of up to "max_batch_bytes".
+        After a failure the connection is retried with exponential backoff
+        between "min_backoff" and "max_backoff" seconds.
         """
         self.host = host
         self.port = port
@@ -42,11 +90,26 @@ class Sender:
         self.log_sends = log_sends
         self.protocol = protocol
         self.batch_size = batch_size
+        self.persistent = persistent and protocol == 'tcp'
+        self.max_batch_bytes = max_batch_bytes
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self._sock = None
+        self._backoff = 0
+        self._reconnect_time = 0
+        self.max_keys = max_keys
+        # (metric, timestamp, tags) -> value. Written by the sending thread only,
+        # the flush thread pops keys of finished seconds, so no lock on the hot path
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+        # values dropped because of max_keys, reported as graphyte.dropped.cnt
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
 
         if self.interval is not None:
-            if queue_size is None:
-                queue_size = int(round(interval)) * 100
-            self._queue = queue.Queue(maxsize=queue_size)
+            self._stop_event = threading.Event()
             self._thread = threading.Thread(target=self._thread_loop)
             self._thread.daemon = True
             self._thread.start()
@@ -60,7 +123,7 @@ class Sender:
         (should be at most "timeout" seconds).
         """
         if self.interval is not None:
-            self._queue.put_nowait(None)
+            self._stop_event.set()
             self._thread.join()
             self.interval = None
 
@@ -100,14 +163,108 @@ class Sender:
         if self.interval is None:
             message = self.build_message(metric, value, timestamp, tags)
             self.send_socket(message)
-        else:
+            return
+
+        key = (metric, int(timestamp), tuple(sorted(tags.items())) if tags else ())
+        counters = self._counters
+        current = counters.get(key)
+        if current is not None:
+            counters[key] = current + value
+        elif self._has_room(key):
+            counters[key] = value
+
+    def gauge(self, metric, value, timestamp=None, tags={}):
+        """Like send(), but when sent several times within a second the last value wins
+        instead of the sum.
+        """
+        if timestamp is None:
+            timestamp = int(time.time())
+
+        if self.interval is None:
+            self.send(metric, value, timestamp, tags)
+            return
+
+        key = (metric, int(timestamp), tuple(sorted(tags.items())) if tags else ())
+        if key in self._gauges or self._has_room(key):
+            self._gauges[key] = value
+
+    def timing(self, metric, value, timestamp=None, tags={}):
+        """Add a duration in milliseconds to the histogram of "metric". Each second is sent as
+        <metric>.p50.ms, <metric>.p95.ms, <metric>.p99.ms, <metric>.max.ms and <metric>.cnt.
+        Without an interval only the value itself is sent as <metric>.ms.
+        """
+        if self.interval is None:
+            self.send(metric + '.ms', value, timestamp, tags)
+            return
+
+        if timestamp is None:
+            timestamp = int(time.time())
+        key = (metric, int(timestamp), tuple(sorted(tags.items())) if tags else ())
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            if not self._has_room(key):
+                return
+            histogram = self._histograms[key] = Histogram()
+        histogram.add(value)
+
+    def _has_room(self, key):
+        if len(self._counters) + len(self._gauges) + len(self._histograms) < self.max_keys:
+            return True
+        with self._dropped_lock:
+            self._dropped += 1
+            first_drop = self._dropped == 1
+        # logged once per interval, the count is sent as a metric
+        if first_drop:
+            logger.error('too many metrics, dropping {!r}'.format(key))
+        return False
+
+    def _pop_dropped(self):
+        with self._dropped_lock:
+            dropped, self._dropped = self._dropped, 0
+        return dropped
+
+    def _connect(self):
+        now = time.time()
+        if now < self._reconnect_time:
+            raise ConnectionError('reconnect to {}:{} in {:.1f} seconds'.format(
+                self.host, self.port, self._reconnect_time - now))
+        try:
+            self._sock = socket.create_connection((self.host, self.port), self.timeout)
+        except OSError:
+            self._backoff = min(self.max_backoff, self._backoff * 2 or self.min_backoff)
+            self._reconnect_time = now + self._backoff
+            raise
+        self._backoff = 0
+
+    def _close_socket(self):
+        if self._sock is not None:
             try:
-                self._queue.put_nowait((metric, value, timestamp, tags))
-            except queue.Full:
-                logger.error('queue full when sending {!r}'.format((metric, value, timestamp, tags)))
+                self._sock.close()
+            finally:
+                self._sock = None
+
+    def _send_persistent(self, message):
+        reused = self._sock is not None
+        if not reused:
+            self._connect()
+        try:
+            self._sock.sendall(message)
+        except OSError:
+            self._close_socket()
+            if not reused:
+                raise
+            # the server may have closed an idle connection, retry once on a new one
+            self._connect()
+            try:
+                self._sock.sendall(message)
+            except OSError:
+                self._close_socket()
+                raise
 
     def send_message(self, message):
-        if self.protocol == 'tcp':
+        if self.persistent:
+            self._send_persistent(message)
+        elif self.protocol == 'tcp':
             sock = socket.create_connection((self.host, self.port), self.timeout)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             try:
@@ -142,63 +299,66 @@ class Sender:
 
     def _thread_loop(self):
         """Background thread used when Sender is in asynchronous/interval mode."""
-        last_check_time = time.time()
-        messages = []
-        while True:
-            # Get first message from queue, blocking until the next time we
-            # should be sending
-            time_since_last_check = time.time() - last_check_time
-            time_till_next_check = max(0, self.interval - time_since_last_check)
-            try:
-                message = self._queue.get(timeout=time_till_next_check)
-            except queue.Empty:
-                pass
-            else:
-                if message is None:
-                    # None is the signal to stop this background thread
-                    break
-                messages.append(message)
-
-                # Get any other messages currently on queue without blocking,
-                # paying attention to None ("stop thread" signal)
-                should_stop = False
-                while True:
-                    try:
-                        message = self._queue.get_nowait()
-                    except queue.Empty:
-                        break
-                    if message is None:
-                        should_stop = True
-                        break
-                    messages.append(message)
-                if should_stop:
-                    break
-
-            # If it's time to send, send what we've collected
-            current_time = time.time()
-            if current_time - last_check_time >= self.interval:
-                last_check_time = current_time
-                messages = self.group_messages(messages)
-                for i in range(0, len(messages), self.batch_size):
-                   batch = messages[i:i + self.batch_size]
-                   self.send_socket(b''.join(batch))
-                messages = []
+        while not self._stop_event.wait(self.interval):
+            self.flush()
 
         # Send any final messages before exiting thread
-        messages = self.group_messages(messages)
-        for i in range(0, len(messages), self.batch_size):
-            batch = messages[i:i + self.batch_size]
-            self.send_socket(b''.join(batch))
+        self.flush(closed_only=False)
+        self._close_socket()
 
-    def group_messages(self, messages):
-        messages_group = []
-        key = lambda x: (x[0], x[2], x[3])
-        messages.sort(key=key)
-        for key, group in groupby(messages, key):
-            new_value = sum([int(m[1]) for m in group])
+    def flush(self, closed_only=True):
+        """Send and remove aggregated values, only those of finished seconds if "closed_only"."""
+        now = int(time.time())
+        messages = []
+        for values in (self._counters, self._gauges):
+            # list() of a dict is atomic, keys added meanwhile are for the current second
+            for key in list(values):
+                if closed_only and key[1] >= now:
+                    continue
+                value = values.pop(key, None)
+                if value is None:
+                    continue
+                metric, timestamp, tags = key
+                try:
+                    messages.append(self.build_message(metric, value, timestamp, dict(tags)))
+                except (TypeError, ValueError) as error:
+                    logger.error('invalid metric {!r}: {}'.format(key, error))
+        for key in list(self._histograms):
+            if closed_only and key[1] >= now:
+                continue
+            histogram = self._histograms.pop(key, None)
+            if histogram is None or not histogram.count:
+                continue
             metric, timestamp, tags = key
-            messages_group.append(self.build_message(metric, new_value, timestamp, tags))
-        return messages_group
+            values = [('{}.p{}.ms'.format(metric, p), round(v, 1)) for p, v in histogram.percentiles().items()]
+            values += [(metric + '.max.ms', round(histogram.max, 1)), (metric + '.cnt', histogram.count)]
+            try:
+                messages.extend(self.build_message(m, v, timestamp, dict(tags)) for m, v in values)
+            except (TypeError, ValueError) as error:
+                logger.error('invalid metric {!r}: {}'.format(key, error))
+        self.send_batches(messages)
+
+    def send_batches(self, messages):
+        """Send built messages, "batch_size" messages per send or, for a
+        persistent connection, as few sendall calls as "max_batch_bytes" allows.
+        """
+        dropped = self._pop_dropped()
+        if dropped:
+            messages.append(self.build_message('graphyte.dropped.cnt', dropped, time.time()))
+        if not self.persistent:
+            for i in range(0, len(messages), self.batch_size):
+                self.send_socket(b''.join(messages[i:i + self.batch_size]))
+            return
+
+        batch, batch_bytes = [], 0
+        for message in messages:
+            if batch and batch_bytes + len(message) > self.max_batch_bytes:
+                self.send_socket(b''.join(batch))
+                batch, batch_bytes = [], 0
+            batch.append(message)
+            batch_bytes += len(message)
+        if batch:
+            self.send_socket(b''.join(batch))
 
 
 def init(*args, **kwargs):
@@ -212,6 +372,16 @@ def send(*args, **kwargs):
     default_sender.send(*args, **kwargs)
 
 
+def gauge(*args, **kwargs):
+    """Send gauge value using default Sender instance."""
+    default_sender.gauge(*args, **kwargs)
+
+
+def timing(*args, **kwargs):
+    """Add duration to a histogram of default Sender instance."""
+    default_sender.timing(*args, **kwargs)
+
+
 if __name__ == '__main__':
     import argparse
 
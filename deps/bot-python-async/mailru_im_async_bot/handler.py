@@ -1,11 +1,17 @@
-from mailru_im_async_bot import log, stat
+import time
+
+from mailru_im_async_bot import log, stat, timing
 from mailru_im_async_bot.event import EventType
 from mailru_im_async_bot.filter import Filter
 from abc import ABC
+from collections import OrderedDict
 import six
 
 
 class HandlerBase(ABC):
+    # event types the handler can match, None means any. Used by Dispatcher to build its routing index
+    event_types = None
+
     def __init__(self, filters=None, callback=None, multiline=False, ignore=None):
         super(HandlerBase, self).__init__()
 
@@ -27,20 +33,33 @@ class HandlerBase(ABC):
             kwargs = {'bot': dispatcher.bot, 'event': event}
             if user:
                 kwargs['user'] = user
-            await self.callback(**kwargs)
+            try:
+                await self.callback(**kwargs)
+            finally:
+                if event.received_at is not None:
+                    timing(
+                        f"event.{event.type.value}.latency",
+                        (time.perf_counter() - event.received_at) * 1000
+                    )
 
 
 class DefaultHandler(HandlerBase):
     def __init__(self, callback=None, *args, **kwargs):
         super(DefaultHandler, self).__init__(callback=callback, *args, **kwargs)
 
+    def check_own(self, event, dispatcher):
+        """ Checks only handler filters. Dispatcher resolves the fallback itself once per event """
+        return super(DefaultHandler, self).check(event=event, dispatcher=dispatcher)
+
     def check(self, event, dispatcher):
-        return super(DefaultHandler, self).check(event=event, dispatcher=dispatcher) and not any(
+        return self.check_own(event=event, dispatcher=dispatcher) and not any(
             h.check(event=event, dispatcher=dispatcher) for h in dispatcher.handlers if h is not self
         )
 
 
 class NewChatMembersHandler(HandlerBase):
+    event_types = (EventType.NEW_CHAT_MEMBERS,)
+
     def check(self, event, dispatcher):
         return (
             super(NewChatMembersHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -49,6 +68,8 @@ class NewChatMembersHandler(HandlerBase):
 
 
 class LeftChatMembersHandler(HandlerBase):
+    event_types = (EventType.LEFT_CHAT_MEMBERS,)
+
     def check(self, event, dispatcher):
         return (
             super(LeftChatMembersHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -57,6 +78,8 @@ class LeftChatMembersHandler(HandlerBase):
 
 
 class PinnedMessageHandler(HandlerBase):
+    event_types = (EventType.PINNED_MESSAGE,)
+
     def check(self, event, dispatcher):
         return (
             super(PinnedMessageHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -65,6 +88,8 @@ class PinnedMessageHandler(HandlerBase):
 
 
 class UnPinnedMessageHandler(HandlerBase):
+    event_types = (EventType.UNPINNED_MESSAGE,)
+
     def check(self, event, dispatcher):
         return (
             super(UnPinnedMessageHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -73,6 +98,8 @@ class UnPinnedMessageHandler(HandlerBase):
 
 
 class MessageHandler(HandlerBase):
+    event_types = (EventType.NEW_MESSAGE,)
+
     def check(self, event, dispatcher):
         return (
                 super(MessageHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -81,6 +108,8 @@ class MessageHandler(HandlerBase):
 
 
 class EditedMessageHandler(HandlerBase):
+    event_types = (EventType.EDITED_MESSAGE,)
+
     def check(self, event, dispatcher):
         return (
                 super(EditedMessageHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -89,6 +118,8 @@ class EditedMessageHandler(HandlerBase):
 
 
 class DeletedMessageHandler(HandlerBase):
+    event_types = (EventType.DELETED_MESSAGE,)
+
     def check(self, event, dispatcher):
         return (
                 super(DeletedMessageHandler, self).check(event=event, dispatcher=dispatcher) and
@@ -107,12 +138,25 @@ class CommandHandler(MessageHandler):
 
         self.command = command
 
+    @property
+    def command(self):
+        return self._command
+
+    @command.setter
+    def command(self, command):
+        self._command = command
+        # unique lower-cased command names, None matches any command
+        self.commands = tuple(OrderedDict.fromkeys(c.lower() for c in (
+            (command,) if isinstance(command, six.string_types) else command
+        ))) if command else None
+
+    @staticmethod
+    def get_command(event):
+        return event.command_key
+
     def check(self, event, dispatcher):
         if super(CommandHandler, self).check(event=event, dispatcher=dispatcher):
-            command = event.data["text"].partition(" ")[0][1:].lower()
-            return not self.command or any((c.lower() == command for c in (
-                (self.command,) if isinstance(self.command, six.string_types) else self.command
-            )))
+            return not self.commands or self.get_command(event) in self.commands
 
 
 class HelpCommandHandler(CommandHandler):
@@ -140,8 +184,8 @@ class FeedbackCommandHandler(CommandHandler):
         self.error_reply = error_reply
 
     async def message_cb(self, bot, event):
-        source = event.data['chat']['chatId']
-        feedback_text = event.data["text"].partition(" ")[2].strip()
+        source = event.chat_id
+        feedback_text = event.text.partition(" ")[2].strip()
 
         if feedback_text:
             await bot.send_text(chat_id=self.target, text=self.message.format(source=source, message=feedback_text))
@@ -156,14 +200,20 @@ class UnknownCommandHandler(CommandHandler):
     def __init__(self, filters=None, callback=None, *args, **kwargs):
         super(UnknownCommandHandler, self).__init__(filters=filters, callback=callback, *args, **kwargs)
 
+    def check_own(self, event, dispatcher):
+        """ Checks only handler filters. Dispatcher resolves the fallback itself once per event """
+        return super(UnknownCommandHandler, self).check(event=event, dispatcher=dispatcher)
+
     def check(self, event, dispatcher):
-        return super(UnknownCommandHandler, self).check(event=event, dispatcher=dispatcher) and not any(
+        return self.check_own(event=event, dispatcher=dispatcher) and not any(
             h.check(event=event, dispatcher=dispatcher) for h in dispatcher.handlers if
             isinstance(h, CommandHandler) and h is not self
         )
 
 
 class BotButtonCommandHandler(HandlerBase):
+    event_types = (EventType.CALLBACK_QUERY,)
+
     def check(self, event, dispatcher):
         return (
             super(BotButtonCommandHandler, self).check(event=event, dispatcher=dispatcher) and
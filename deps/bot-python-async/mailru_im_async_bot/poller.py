@@ -0,0 +1,70 @@
+import asyncio
+from asyncio import CancelledError, Task
+
+import aiohttp
+
+from mailru_im_async_bot import log, gauge
+from mailru_im_async_bot.trace_config import trace_config
+
+
+class Poller:
+    """
+    Shared polling engine for many bots.
+    Owns a single http session (connection pool), a single events queue and a single dispatch task.
+    Bots created with poller=... run only their long-poll loop and put events tagged with the bot into the queue.
+    """
+
+    def __init__(self, request_timeout_s=7, task_max_len=100000, connections_limit=0, loop=None):
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        self.request_timeout_s = request_timeout_s
+        self.task_max_len = task_max_len
+        self.events = asyncio.Queue(maxsize=task_max_len)
+        self.bots = set()
+        # handler tasks in flight of all attached bots, maintained by their dispatchers
+        self.tasks_in_flight = 0
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=connections_limit),
+            timeout=aiohttp.ClientTimeout(total=request_timeout_s),
+            trace_configs=[trace_config]
+        )
+
+        self._dispatcher_task = None
+
+    def attach(self, bot):
+        self.bots.add(bot)
+        if self._dispatcher_task is None:
+            log.info('start shared dispatcher')
+            self._dispatcher_task = self.loop.create_task(self.dispatch())
+
+    def detach(self, bot):
+        self.bots.discard(bot)
+
+    async def put(self, bot, event):
+        await self.events.put((bot, event))
+
+    async def dispatch(self):
+        while True:
+            try:
+                task_len = self.tasks_in_flight
+                gauge('coroutine.cnt', task_len)
+                if task_len < self.task_max_len:
+                    bot, event = await self.events.get()
+                    # events of a stopped bot may still be in the queue
+                    if bot in self.bots:
+                        await bot.dispatcher.submit(event)
+                else:
+                    log.critical('task limit was reached: {}'.format(task_len))
+                    await asyncio.sleep(1)
+            except CancelledError:
+                log.warning("shared dispatcher cancelled")
+                raise
+            except Exception:
+                log.exception("Exception in shared dispatcher!")
+
+    async def stop(self):
+        log.info('stop shared poller')
+        if isinstance(self._dispatcher_task, Task):
+            self._dispatcher_task.cancel()
+        self._dispatcher_task = None
+        self.bots.clear()
+        await self.session.close()
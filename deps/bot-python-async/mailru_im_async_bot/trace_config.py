@@ -1,39 +1,57 @@
 from asyncio import CancelledError
 from mailru_im_async_bot import log
 import datetime
+import logging
+import random
 import aiohttp
 
 
+# share of responses which bodies are logged at DEBUG level and the max logged length of a body
+BODY_SAMPLE_RATE = 1.0
+BODY_MAX_LEN = 1000
+
+
 def is_printable_content_type(content_type):
     return 'text' in content_type or 'json' in content_type or 'xml' in content_type or 'html' in content_type
 
 
+def format_headers(headers):
+    return "\n".join((f"{key}: {value}" for (key, value) in headers.items()))
+
+
 async def on_request_start(session, trace_config_ctx, params):
+    # nothing is formatted unless it is going to be logged
+    trace_config_ctx.debug = log.isEnabledFor(logging.DEBUG)
     trace_config_ctx.time_start = datetime.datetime.now()
     trace_config_ctx.method = params.method
     trace_config_ctx.url = params.url
-    trace_config_ctx.headers = "\n".join((f"{key}: {value}" for (key, value) in params.headers.items()))
+    trace_config_ctx.headers = params.headers
     trace_config_ctx.chunk = None
 
 
 async def on_request_chunk_sent(session, trace_config_ctx, params):
-    trace_config_ctx.chunk = params.chunk[:1000]
+    if trace_config_ctx.debug:
+        trace_config_ctx.chunk = params.chunk[:BODY_MAX_LEN]
 
 
 async def on_request_end(session, trace_config_ctx, params):
+    if not trace_config_ctx.debug:
+        return
     trace_config_ctx.time_end = datetime.datetime.now()
-    # if params.response.content_type in ('application/json', 'text/html', None):
-    if is_printable_content_type(params.response.content_type):
-        params.response._text = await params.response.text()
+    if random.random() >= BODY_SAMPLE_RATE:
+        body = "[not sampled]"
+    elif is_printable_content_type(params.response.content_type):
+        # read() keeps the body in the response, so the caller doesn't read it again
+        body = (await params.response.read())[:BODY_MAX_LEN].decode(params.response.charset or 'utf-8', 'replace')
     else:
-        params.response._text = "[binary data]"
+        body = "[binary data]"
 
     log.debug(
         "\n[request {time}]\n{method} {url}\n{headers}\n{body}".format(
             time=trace_config_ctx.time_start,
             method=trace_config_ctx.method,
             url=trace_config_ctx.url,
-            headers=trace_config_ctx.headers,
+            headers=format_headers(trace_config_ctx.headers),
             body=str(trace_config_ctx.chunk) + "\n" if trace_config_ctx.chunk else ""
         ))
 
@@ -42,8 +60,8 @@ async def on_request_end(session, trace_config_ctx, params):
             time=trace_config_ctx.time_end,
             status_code=params.response.status,
             reason=params.response.reason,
-            headers="\n".join((f"{key}: {value}" for (key, value) in params.response.headers.items())),
-            body=params.response._text
+            headers=format_headers(params.response.headers),
+            body=body
         )
     )
 
@@ -51,21 +69,22 @@ async def on_request_end(session, trace_config_ctx, params):
 async def on_request_exception(session, trace_config_ctx, params):
     trace_config_ctx.time_end = datetime.datetime.now()
     if isinstance(params.exception, CancelledError):
-        log.debug(
-            "\n[request {time}]\n{method} {url}\n{headers}{body}".format(
-                time=trace_config_ctx.time_start,
-                method=trace_config_ctx.method,
-                url=trace_config_ctx.url,
-                headers=trace_config_ctx.headers,
-                body=str(trace_config_ctx.chunk) + "\n" if trace_config_ctx.chunk else ""
-            ))
+        if trace_config_ctx.debug:
+            log.debug(
+                "\n[request {time}]\n{method} {url}\n{headers}{body}".format(
+                    time=trace_config_ctx.time_start,
+                    method=trace_config_ctx.method,
+                    url=trace_config_ctx.url,
+                    headers=format_headers(trace_config_ctx.headers),
+                    body=str(trace_config_ctx.chunk) + "\n" if trace_config_ctx.chunk else ""
+                ))
         log.warning("request cancelled")
     else:
         log.exception("\n[request {time}]\n{method} {url}\n{headers}\n{type_}{exception}\n".format(
             time=trace_config_ctx.time_start,
             method=trace_config_ctx.method,
             url=trace_config_ctx.url,
-            headers=trace_config_ctx.headers,
+            headers=format_headers(trace_config_ctx.headers),
             type_=str(type(params.exception)),
             exception=str(params.exception)
         ))
@@ -5,13 +5,29 @@ log = logging.getLogger(__name__)
 
 
 class User:
+    __slots__ = ('id', 'bot', 'task', 'parent_event_id', 'handler', 'last_seen', '_events')
+
     def __init__(self, id, bot, task=None, parent_event_id=None):
         self.id = id
         self.bot = bot
         self.task = task
         self.parent_event_id = parent_event_id
-        self.events = asyncio.Queue(maxsize=bot.task_max_len)
         self.handler = None
+        self.last_seen = 0
+        # most users never run a multiline handler, so the queue is created on first use
+        self._events = None
+
+    @property
+    def events(self):
+        if self._events is None:
+            self._events = asyncio.Queue(maxsize=self.bot.user_queue_max_len)
+        return self._events
+
+    def has_events(self):
+        return self._events is not None and not self._events.empty()
+
+    def is_idle(self):
+        return (self.task is None or self.task.done()) and not self.has_events()
 
     async def wait_response(self):
         log.info(self)
@@ -19,4 +35,3 @@ class User:
 
     def __str__(self):
         return f'User(id={self.id}, parent_event_id={self.parent_event_id})'
-
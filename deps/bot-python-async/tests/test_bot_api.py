@@ -0,0 +1,65 @@
+import ast
+import inspect
+
+from mailru_im_async_bot import bot as bot_module
+from mailru_im_async_bot.bot import Bot
+
+
+class FakeResponse:
+    method = 'GET'
+    status = 200
+
+    async def json(self):
+        return {'ok': True}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, *args, **kwargs):
+        self.urls.append(url)
+        return FakeResponse()
+
+
+class FakePoller:
+    def __init__(self):
+        self.session = FakeSession()
+
+
+def api_methods():
+    """ (method name, keywords of its _request_cm call) of every Bot method which makes a request """
+    tree = ast.parse(inspect.getsource(bot_module))
+    cls = next(node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == 'Bot')
+    for method in cls.body:
+        if not isinstance(method, ast.AsyncFunctionDef):
+            continue
+        for node in ast.walk(method):
+            if isinstance(node, ast.Call) and getattr(node.func, 'attr', None) == '_request_cm':
+                yield method.name, {keyword.arg: keyword.value for keyword in node.keywords}
+
+
+def test_api_methods_declare_their_own_metric_name():
+    methods = list(api_methods())
+    assert len(methods) > 10
+    for name, keywords in methods:
+        assert 'metric_name' in keywords, name
+        assert ast.literal_eval(keywords['metric_name']) == name
+
+
+def test_request_stats_use_declared_metric_name(run, monkeypatch):
+    stats = []
+    monkeypatch.setattr(bot_module, 'stat', lambda metric, value: stats.append(metric))
+
+    async def self_get():
+        bot = Bot(token='token', poller=FakePoller())
+        return await bot.self_get()
+
+    assert run(self_get()) == {'ok': True}
+    assert stats == ['botapi.self_get.cnt', 'botapi.self_get.GET.200.cnt']
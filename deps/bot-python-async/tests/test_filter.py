@@ -0,0 +1,69 @@
+import pytest
+
+from mailru_im_async_bot.event import Event, EventType
+from mailru_im_async_bot.filter import Filter, FilterBase, MessageFilter, TextFilter
+
+
+def message(text):
+    return Event(id=1, type_=EventType.NEW_MESSAGE, data={
+        'text': text, 'from': {'userId': 'user'}, 'chat': {'chatId': 'user', 'type': 'private'}, 'msgId': '1'
+    })
+
+
+def callback(data):
+    return Event(id=1, type_=EventType.CALLBACK_QUERY, data={'callbackData': data, 'from': {'userId': 'user'}})
+
+
+class LongMessageFilter(MessageFilter):
+    def filter(self, event):
+        return super(LongMessageFilter, self).filter(event) and len(event.text) > 5
+
+
+class NotGreetingFilter(TextFilter):
+    def filter(self, event):
+        return not super(NotGreetingFilter, self).filter(event)
+
+
+class EverythingFilter(FilterBase):
+    def filter(self, event):
+        return True
+
+
+class NoHookFilter(FilterBase):
+    pass
+
+
+def test_filter_override_of_a_concrete_filter_is_used():
+    long_message = LongMessageFilter()
+    assert not long_message(message('hi'))
+    assert long_message(message('hello world'))
+    assert not long_message(callback('hello world'))
+    assert not (long_message & Filter.message)(message('hi'))
+    assert (long_message | Filter.command)(message('/go'))
+
+
+def test_filter_override_can_invert_its_parent():
+    not_greeting = NotGreetingFilter('hello')
+    assert not not_greeting(message('Hello'))
+    assert not_greeting(message('bye'))
+    assert not_greeting.filter(message('bye'))
+
+
+def test_filter_only_subclass_of_filter_base():
+    assert EverythingFilter()(message('anything'))
+    assert (EverythingFilter() & ~Filter.command)(message('text'))
+
+
+def test_filter_without_hooks_fails_clearly():
+    with pytest.raises(NotImplementedError):
+        NoHookFilter()(message('text'))
+
+
+def test_compiled_expressions():
+    assert Filter.text_only(message('just text'))
+    assert not Filter.text_only(message('/start'))
+    assert not Filter.text_only(message('https://example.com'))
+    assert Filter.callback_data('cb')(callback('cb'))
+    assert not (~Filter.callback_data('cb'))(callback('cb'))
+    assert TextFilter(['Yes', 'no'])(message('YES'))
+    assert not TextFilter('Yes', case_sensitive=True)(message('yes'))
@@ -0,0 +1,43 @@
+from mailru_im_async_bot.dispatcher import Dispatcher
+from mailru_im_async_bot.event import Event, EventType
+from mailru_im_async_bot.handler import CommandHandler, MessageHandler, DefaultHandler
+
+
+def message(text):
+    return Event(id=1, type_=EventType.NEW_MESSAGE, data={
+        'text': text, 'from': {'userId': 'user'}, 'chat': {'chatId': 'user', 'type': 'private'}, 'msgId': '1'
+    })
+
+
+def dispatcher(*handlers):
+    dispatcher_ = Dispatcher(bot=None)
+    for handler in handlers:
+        dispatcher_.add_handler(handler)
+    return dispatcher_
+
+
+def test_commands_differing_by_case_route_once():
+    handler = CommandHandler(command=['Start', 'start', 'START'])
+    assert handler.commands == ('start',)
+    assert dispatcher(handler)._route(message('/start')) == [handler]
+
+
+def test_handler_registered_twice_routes_once():
+    handler = CommandHandler(command='start')
+    assert dispatcher(handler, handler)._route(message('/Start now')) == [handler]
+
+
+def test_routes_keep_registration_order():
+    first = MessageHandler()
+    command = CommandHandler(command='start')
+    last = MessageHandler()
+    default = DefaultHandler()
+    dispatcher_ = dispatcher(first, command, default, last)
+    assert dispatcher_._route(message('/start')) == [first, command, last]
+    assert dispatcher_._route(message('hello')) == [first, last]
+
+
+def test_default_handler_runs_when_nothing_else_matches():
+    command = CommandHandler(command='start')
+    default = DefaultHandler()
+    assert dispatcher(command, default)._route(message('/help')) == [default]
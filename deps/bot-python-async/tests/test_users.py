@@ -0,0 +1,79 @@
+import asyncio
+from collections import OrderedDict
+
+from mailru_im_async_bot.dispatcher import Dispatcher
+from mailru_im_async_bot.user import User
+
+
+class FakeLoop:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+
+class FakeBot:
+    def __init__(self, user_ttl_s=60, users_max_len=100):
+        self.loop = FakeLoop()
+        self.users = OrderedDict()
+        self.user_ttl_s = user_ttl_s
+        self.users_max_len = users_max_len
+        self.user_queue_max_len = 10
+
+
+class RunningTask:
+    def done(self):
+        return False
+
+
+def test_user_queue_is_created_on_first_use():
+    user = User(1, FakeBot())
+    assert not user.has_events()
+    assert user._events is None
+    assert user.events.maxsize == 10
+    assert user.events is user.events
+
+
+def test_idle_users_are_evicted_over_the_limit():
+    bot = FakeBot(users_max_len=10)
+    dispatcher = Dispatcher(bot)
+    for user_id in range(100):
+        dispatcher._get_user(user_id)
+    assert len(bot.users) == 10
+    assert list(bot.users) == list(range(90, 100))
+
+
+def test_idle_users_are_evicted_after_ttl():
+    bot = FakeBot(user_ttl_s=60)
+    dispatcher = Dispatcher(bot)
+    dispatcher._get_user(1)
+    dispatcher._get_user(2)
+    bot.loop.now = 30
+    dispatcher._get_user(2)
+    bot.loop.now = 61
+    dispatcher._get_user(3)
+    assert list(bot.users) == [2, 3]
+
+
+def test_busy_users_are_kept():
+    bot = FakeBot(user_ttl_s=60, users_max_len=1)
+    dispatcher = Dispatcher(bot)
+    dispatcher._get_user(1).task = RunningTask()
+    waiting = dispatcher._get_user(2)
+    # the user being dispatched is not evicted even when it is idle and over the limit
+    assert bot.users[2] is waiting
+    waiting.events.put_nowait(object())
+    bot.loop.now = 120
+    dispatcher._get_user(3)
+    assert set(bot.users) == {1, 2, 3}
+
+
+def test_known_user_is_reused_and_moved_to_the_tail():
+    bot = FakeBot()
+    dispatcher = Dispatcher(bot)
+    first = dispatcher._get_user(1)
+    dispatcher._get_user(2)
+    assert dispatcher._get_user(1) is first
+    assert list(bot.users) == [2, 1]
+    assert isinstance(first.events, asyncio.Queue)
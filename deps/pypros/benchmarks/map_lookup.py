@@ -0,0 +1,59 @@
+"""
+Time of Map.srv_by_bkr on a large map: the lookup which rebuilt the list of bucket
+starts on every call, as before, against bisecting the prebuilt array, with and without the route cache.
+
+    python -m benchmarks.map_lookup --buckets 65536 --lookups 2000
+"""
+import argparse
+import bisect
+import random
+import time
+
+from pypros.alias import Alias
+from pypros.map import Map, Record
+
+
+def rebuilt(m, key):
+    keys = [r.bkr_start for r in m.bkrs]
+    return m.bkrs[bisect.bisect_right(keys, key) - 1]
+
+
+def uncached(m, key):
+    m._route_cache.clear()
+    return m.srv_by_bkr(key)
+
+
+def cached(m, key):
+    return m.srv_by_bkr(key)
+
+
+def measure(lookup, m, keys):
+    started = time.perf_counter()
+    found = [lookup(m, key) for key in keys]
+    return (time.perf_counter() - started) / len(keys), found
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buckets', type=int, default=65536)
+    parser.add_argument('--lookups', type=int, default=2000)
+    parser.add_argument('--hot-keys', type=int, default=100)
+    args = parser.parse_args()
+    m = Map()
+    alias = Alias('none.a.none')
+    step = 2**32 // args.buckets
+    for i in range(args.buckets):
+        m.append(Record(i * step, 'host', i, alias))
+    rnd = random.Random(1)
+    hot = [rnd.randrange(2**32) for _ in range(args.hot_keys)]
+    keys = [rnd.choice(hot) for _ in range(args.lookups)]
+    expected = None
+    for name, lookup in (('rebuilt', rebuilt), ('bisect', uncached), ('cached', cached)):
+        per_lookup, found = measure(lookup, m, keys)
+        assert expected is None or found == expected
+        expected = found
+        print(f"{name:>8}: {per_lookup * 1e6:8.2f} us per lookup, {args.buckets} buckets")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Time to build one packet of many TLVs: OStream appending to a bytearray
+against the same writes concatenated to an immutable bytes object, as OStream did before.
+
+    python -m benchmarks.ostream --tlvs 20000
+"""
+import argparse
+import struct
+import time
+
+from pypros.IO import OStream
+
+
+class BytesOStream:
+    # the writer OStream replaced: every put copies the whole buffer
+    def __init__(self):
+        self.data = bytes()
+
+    def putU32(self, num):
+        self.data += struct.pack('<L', num)
+        return self
+
+    def putLps(self, data):
+        self.putU32(len(data))
+        self.data += data
+        return self
+
+    def putTlv(self, tag, data):
+        self.putU32(tag)
+        return self.putLps(data)
+
+
+def measure(stream_class, tlvs):
+    value = b'v' * 32
+    started = time.perf_counter()
+    out = stream_class()
+    for tag in range(tlvs):
+        out.putTlv(tag, value)
+    data = out.data
+    return time.perf_counter() - started, data
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tlvs', type=int, default=20000)
+    args = parser.parse_args()
+    bytes_s, bytes_data = measure(BytesOStream, args.tlvs)
+    buf_s, buf_data = measure(OStream, args.tlvs)
+    assert bytes_data == buf_data
+    for name, elapsed in (('bytes', bytes_s), ('bytearray', buf_s)):
+        print(f"{name:>9}: {elapsed * 1000:8.1f} ms for {args.tlvs} TLVs, {len(buf_data)} bytes")
+
+
+if __name__ == '__main__':
+    main()
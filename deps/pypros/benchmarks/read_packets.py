@@ -0,0 +1,63 @@
+"""
+Packets per second received over a loopback TCP connection: one read_packet call per packet,
+two awaited reads each, against read_packets splitting every 64 KiB chunk with a FrameParser.
+
+    python -m benchmarks.read_packets --packets 200000 --body-size 64
+"""
+import argparse
+import asyncio
+import time
+
+from pypros.ipros import read_packet, read_packets
+from pypros.packet import Packet
+
+
+async def one_by_one(r):
+    count = 0
+    while await read_packet(r) is not None:
+        count += 1
+    return count
+
+
+async def chunked(r):
+    count = 0
+    async for _ in read_packets(r):
+        count += 1
+    return count
+
+
+async def measure(read, payload):
+    async def send(r, w):
+        w.write(payload)
+        await w.drain()
+        w.close()
+
+    server = await asyncio.start_server(send, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    started = time.perf_counter()
+    r, w = await asyncio.open_connection('127.0.0.1', port)
+    count = await read(r)
+    elapsed = time.perf_counter() - started
+    w.close()
+    server.close()
+    await server.wait_closed()
+    return count, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--packets', type=int, default=200000)
+    parser.add_argument('--body-size', type=int, default=64)
+    args = parser.parse_args()
+    body = b'b' * args.body_size
+    payload = b''.join(Packet(0x100, i + 1, body).dump() for i in range(args.packets))
+    loop = asyncio.new_event_loop()
+    for name, read in (('read_packet', one_by_one), ('read_packets', chunked)):
+        count, elapsed = loop.run_until_complete(measure(read, payload))
+        assert count == args.packets
+        print(f"{name:>12}: {count / elapsed:9.0f} packets/s, {args.body_size} byte bodies")
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,14 @@ import struct
 import socket
 import random
 import types
-import varint
+
+
+_U8 = struct.Struct('B')
+_U16 = struct.Struct('<H')
+_U16N = struct.Struct('>H')
+_U32 = struct.Struct('<L')
+_I32 = struct.Struct('<l')
+_U64 = struct.Struct('<Q')
 
 
 def parseScheme(istr, scheme):
@@ -110,21 +117,42 @@ class MsgId(object):
 
 
 class IStream(object):
+    """
+    Reader over a memoryview: sub-streams share the buffer of the parent,
+    bytes are copied only by getBlob/getAll/getStr and by data.
+    Reading past the end raises struct.error
+    """
+
     def __init__(self,data):
-        self.data = data
-        self.dlen = len(data)
+        self._view = data if isinstance(data, memoryview) else memoryview(data)
+        self._data = data if isinstance(data, bytes) else None
+        self.dlen = len(self._view)
         self.offset = 0
 
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = self._view.tobytes()
+        return self._data
+
     def __str__(self):
         return str(self.data)
 
-    def __unpack(self, fmt):
-        r = struct.unpack_from(fmt, self.data, self.offset)
-        self.offset += struct.calcsize(fmt)
+    def __unpack(self, st):
+        r = st.unpack_from(self._view, self.offset)[0]
+        self.offset += st.size
+        return r
+
+    def __slice(self, length):
+        end = self.offset + length
+        if end > self.dlen:
+            raise struct.error('{} bytes requested, {} available'.format(length, self.inAvail()))
+        r = self._view[self.offset:end]
+        self.offset = end
         return r
 
     def getBlob(self, length):
-        return self.__unpack('<{0}s'.format(length))[0]
+        return self.__slice(length).tobytes()
 
     def getAll(self):
         return self.getBlob(self.inAvail())
@@ -140,26 +168,27 @@ class IStream(object):
         return (self.getU32(), self.getU32(), self.getU32())
 
     def getU8(self):
-        return self.__unpack('B')[0];
+        return self.__unpack(_U8)
 
     def getU16(self):
-        return self.__unpack('<H')[0];
+        return self.__unpack(_U16)
 
     def getU16n(self):
-        return self.__unpack('>H')[0];
+        return self.__unpack(_U16N)
 
     def getU32(self):
-        return self.__unpack('<L')[0];
+        return self.__unpack(_U32)
 
     def getU64(self):
-        return self.__unpack('<Q')[0];
+        return self.__unpack(_U64)
 
     def getLps(self):
         length = self.getU32()
-        return IStream(self.__unpack('<{0}s'.format(length))[0])
+        return IStream(self.__slice(length))
 
     def getStr(self):
-        return str(self.getLps().data, encoding='utf8')
+        length = self.getU32()
+        return str(self.__slice(length), encoding='utf8')
 
     def getTlv(self):
         return self.getU32(), self.getLps()
@@ -182,17 +211,28 @@ class IStream(object):
             yield lps
 
     def getVarInt(self):
-        v = varint.decode_bytes(self.data[self.offset:])
-        self.offset += len(varint.encode(v))
-        return v
+        # unsigned LEB128, decoded in place
+        view, offset, dlen = self._view, self.offset, self.dlen
+        result = shift = 0
+        while True:
+            if offset >= dlen:
+                raise struct.error('truncated varint')
+            b = view[offset]
+            offset += 1
+            result |= (b & 0x7f) << shift
+            if not b & 0x80:
+                break
+            shift += 7
+        self.offset = offset
+        return result
 
     def getVarIntLps(self):
         length = self.getVarInt()
-        return IStream(self.__unpack('<{0}s'.format(length))[0])
+        return IStream(self.__slice(length))
 
     def getVarIntLpsNum(self):
         length = self.getVarInt()
-        r = IStream(self.__unpack('<{0}s'.format(length))[0])
+        r = IStream(self.__slice(length))
         if(length == 2):
             return r.getU16()
         if(length == 4):
@@ -228,33 +268,49 @@ class IStream(object):
         return self.dlen - self.offset
 
 class OStream(object):
+    """
+    Writer backed by a growable bytearray: every put appends in place,
+    data makes the only copy of the whole buffer
+    """
+
     def __init__(self, data = bytes()):
-        self.data = data
+        self._buf = bytearray(data)
+
+    @property
+    def data(self):
+        return bytes(self._buf)
+
+    @data.setter
+    def data(self, data):
+        self._buf = bytearray(data)
+
+    def __len__(self):
+        return len(self._buf)
 
     def __str__(self):
         return str(self.data)
 
-    def __pack(self, fmt, *args):
-        self.data += struct.pack(fmt, *args)
+    def __pack(self, st, num):
+        self._buf += st.pack(num)
         return self
 
     def putU8(self, num):
-        return self.__pack('B', num)
+        return self.__pack(_U8, num)
 
     def putMsgId(self, mid):
         return self.putU64(int(mid))
 
     def putU16(self, num):
-        return self.__pack('<H', num)
+        return self.__pack(_U16, num)
 
     def putU16n(self, num):
-        return self.__pack('>H', num)
+        return self.__pack(_U16N, num)
 
     def putU32(self, num):
-        return self.__pack('<L', num)
+        return self.__pack(_U32, num)
 
     def putI32(self, num):
-        return self.__pack('<l', num)
+        return self.__pack(_I32, num)
 
     def putRid(self, type, id):
         return self.putU64(int(Rid(type, id)))
@@ -266,16 +322,19 @@ class OStream(object):
         return self.putReqId().putRid(type, id).putOrigin()
 
     def putU64(self, num):
-        return self.__pack('<Q', num)
+        return self.__pack(_U64, num)
 
     def putLps(self, data):
+        if isinstance(data, str):
+            data = bytes(data, encoding='utf8')
         self.putU32(len(data))
         return self.putBlob(data)
 
     def putBlob(self, data):
         if isinstance(data, str):
             data = bytes(data, encoding='utf8')
-        return self.__pack('<{0}s'.format(len(data)), data)
+        self._buf += data
+        return self
 
     def putTlv(self, tag, data):
         self.putU32(tag)
@@ -283,7 +342,8 @@ class OStream(object):
 
     def putTlvU32(self, tag, n):
         self.putU32(tag)
-        return self.putLps(OStream().putU32(n).data)
+        self.putU32(_U32.size)
+        return self.putU32(n)
 
     def putIPkt(self, msg, data):
         self.putU32(msg)
@@ -292,13 +352,16 @@ class OStream(object):
         return self.putBlob(data)
 
     def putISPkt(self, msg, key, data):
-        paylo = OStream().putLps(key).putBlob(data)
+        if isinstance(key, str):
+            key = bytes(key, encoding='utf8')
+        if isinstance(data, str):
+            data = bytes(data, encoding='utf8')
 
         self.putU16(msg)
         self.putU16(1)
-        self.putU32(len(paylo.data))
+        self.putU32(_U32.size + len(key) + len(data))
         self.putU32(0)
-        return self.putBlob(paylo.data)
+        return self.putLps(key).putBlob(data)
 
     def putIPv4(self, addr):
         if isinstance(addr, list):
@@ -314,20 +377,36 @@ class OStream(object):
         return OCLps(self)
 
 class OLps(OStream):
+    """
+    Writes straight into the parent stream after a reserved length,
+    which is filled in on exit
+    """
+    HEADER_SIZE = _U32.size
+
     def __init__(self, ostream):
         super(OLps, self).__init__()
         self.ostream = ostream
+        self._buf = ostream._buf
+        self._start = len(self._buf)
+        self._buf += bytes(self.HEADER_SIZE)
+
+    @property
+    def data(self):
+        return bytes(self._buf[self._start + self.HEADER_SIZE:])
 
     def __enter__(self):
         return self
 
     def __exit__(self, exception, value, traceback):
         if exception:
+            del self._buf[self._start:]
             return False
 
-        self.ostream.putLps(self.data)
+        _U32.pack_into(self._buf, self._start, len(self._buf) - self._start - _U32.size)
 
 class OCLps(OLps):
+    HEADER_SIZE = _U32.size * 2
+
     def __init__(self, ostream):
         super(OCLps, self).__init__(ostream)
         self.lpsCount = 0
@@ -335,10 +414,12 @@ class OCLps(OLps):
     def putLps(self, data):
         super(OCLps, self).putLps(data)
         self.lpsCount += 1
+        return self
 
     def __exit__(self, exception, value, traceback):
-        self.data = struct.pack('<L', self.lpsCount) + self.data
-        super(OCLps, self).__exit__(exception, value, traceback)
+        if not exception:
+            _U32.pack_into(self._buf, self._start + _U32.size, self.lpsCount)
+        return super(OCLps, self).__exit__(exception, value, traceback)
 
 class IPacket(IStream):
     def __init__(self, msg, seq, proto, data):
@@ -10,6 +10,8 @@ import asyncio
 
 G_cur_role = None
 G_map_received = {}
+# incoming packets with a msg id missing in MsgId
+G_unknown_msg_count = 0
 role_changed_cb = None
 G_git_hash = 'unknown'
 try:
@@ -39,6 +41,9 @@ class MsgId:
     MOVED    =16
     FORK     =17
 
+# msg id -> MsgId attribute name, which is also the IncomingHandlers method name
+_MSG_NAMES = {v: n for n, v in vars(MsgId).items() if isinstance(v, int)}
+
 class JoinTag:
     NONE        = 0
     ASSIGNED    = 1
@@ -146,9 +151,14 @@ class IncomingHandlers:
         return await flop(dst)
 
 async def incoming_handler(cn: ipros.Conn, p: Packet):
-    for methname in dir(MsgId):
-        if getattr(MsgId, methname) == p.msg:
-            cb = getattr(IncomingHandlers, methname, None)
-            if cb:
-                await cb(cn, p)
+    global G_unknown_msg_count
+    methname = _MSG_NAMES.get(p.msg)
+    if methname is None:
+        G_unknown_msg_count += 1
+        log.warning('ctlr: unknown msg {} ({} so far)'.format(p, G_unknown_msg_count))
+        return
+    # looked up on every packet since handlers such as CHECK are set by the application
+    cb = getattr(IncomingHandlers, methname, None)
+    if cb:
+        await cb(cn, p)
 
@@ -120,12 +120,11 @@ class Conn:
 
     async def _do_read(self):
         try:
-            while True:
-                p = await read_packet(self.reader)
-                if p is None:
-                    log.warn('Connection closed by peer {}'.format(self))
-                    return await self.shutdown()
-                asyncio.get_event_loop().create_task(self._process(p))
+            loop = asyncio.get_event_loop()
+            async for p in read_packets(self.reader):
+                loop.create_task(self._process(p))
+            log.warn('Connection closed by peer {}'.format(self))
+            return await self.shutdown()
         except asyncio.CancelledError:
             log.warn('{} reader shutdown'.format(self))
             raise
@@ -161,14 +160,62 @@ class Conn:
         else:
             log.error('unexpected reply {} from {}'.format(sync, self))
 
+# msg, body length, sync
+PACKET_HEADER = struct.Struct('<LLL')
+READ_CHUNK_SIZE = 65536
+
 async def read_packet(r):
-    hdr = await r.read(12)
-    if hdr == bytes():
-        return None
-    msg, len, sync = IStream(hdr).getIproHdr()
-    body = await r.read(len)
+    """Read exactly one packet, None if the peer closed the connection between packets"""
+    try:
+        hdr = await r.readexactly(PACKET_HEADER.size)
+    except asyncio.IncompleteReadError as x:
+        if not x.partial:
+            return None
+        raise struct.error('connection closed inside a packet header')
+    msg, length, sync = PACKET_HEADER.unpack(hdr)
+    try:
+        body = await r.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise struct.error('connection closed inside a packet body')
     return Packet(msg, sync, body)
 
+class FrameParser:
+    """Splits a byte stream into packets, a chunk may hold any number of packets or a part of one"""
+    def __init__(self):
+        self._buf = bytearray()
+
+    def feed(self, data) -> list:
+        buf = self._buf
+        buf += data
+        packets = []
+        offset = 0
+        end = len(buf)
+        while end - offset >= PACKET_HEADER.size:
+            msg, length, sync = PACKET_HEADER.unpack_from(buf, offset)
+            start = offset + PACKET_HEADER.size
+            if end - start < length:
+                break
+            packets.append(Packet(msg, sync, bytes(buf[start:start + length])))
+            offset = start + length
+        if offset:
+            del buf[:offset]
+        return packets
+
+    def pending(self):
+        return len(self._buf)
+
+async def read_packets(r):
+    """Yield packets until the peer closes the connection, parsing every packet received in one read"""
+    parser = FrameParser()
+    while True:
+        data = await r.read(READ_CHUNK_SIZE)
+        if not data:
+            if parser.pending():
+                raise struct.error('connection closed inside a packet')
+            return
+        for p in parser.feed(data):
+            yield p
+
 
 class IncomingRequest:
     def __init__(self, req: Packet, sender: Alias, writer):
@@ -191,13 +238,13 @@ class Server:
         try:
             writer.write(Packet.hello(G_self_alias, Conn.default_flags).dump())
             hello = await read_packet(reader)
+            if hello is None:
+                return
             peer = Alias.load(IStream(hello.body).getLps())
             log.info('{} connected'.format(peer))
-            while True:
-                p = await read_packet(reader)
-                if p is None:
-                    break
-                asyncio.get_event_loop().create_task(self.request_cb(IncomingRequest(p, peer, writer)))
+            loop = asyncio.get_event_loop()
+            async for p in read_packets(reader):
+                loop.create_task(self.request_cb(IncomingRequest(p, peer, writer)))
         finally:
             log.info('{} disconnected'.format(peer))
 
@@ -1,4 +1,5 @@
 import bisect
+from array import array
 from pypros.IO import IStream
 from pypros.log import log
 from pypros.alias import Alias
@@ -38,10 +39,13 @@ class Role:
 
     @classmethod
     def by_id(cls, id):
-        for n in cls.__dict__:
-            if getattr(cls, n) == id:
-                return n.lower()
-        raise Exception('unknown srv role: {}'.format(id))
+        try:
+            return _ROLE_NAMES[id]
+        except KeyError:
+            raise Exception('unknown srv role: {}'.format(id))
+
+# role id -> lower-cased role name
+_ROLE_NAMES = {v: n.lower() for n, v in vars(Role).items() if isinstance(v, int)}
 
 class Node:
     def __init__(self, istr):
@@ -77,12 +81,18 @@ class Srv:
         return '{}/{} ({}) = {}:{}'.format(self.node_id, self.alias, self.role, self.host, self.port)
 
 class Map:
+    # max number of bkr -> record lookups remembered, the cache is dropped when full
+    ROUTE_CACHE_SIZE = 4096
+
     def __init__(self, istr: IStream = None):
         self.type = ''
         self.node = {}
         self.srv = {}
         self.node_masters = {}
         self.bkrs = []
+        # bkr_start of every record in self.bkrs, bisected by srv_by_bkr
+        self.bkr_starts = array('L')
+        self._route_cache = {}
 
         if istr:
             istr.tlvForeach({
@@ -94,14 +104,24 @@ class Map:
 
     def append(self, r: Record):
         assert not self.bkrs and r.bkr_start == 0 or self.bkrs[-1].bkr_start < r.bkr_start
+        self._append(r)
+
+    def _append(self, r: Record):
         self.bkrs.append(r)
+        self.bkr_starts.append(r.bkr_start)
+        self._route_cache.clear()
 
     def srv_by_bkr(self, key) -> Record:
-        keys = [r.bkr_start for r in self.bkrs]
-        i = bisect.bisect_right(keys, key)
+        r = self._route_cache.get(key)
+        if r is not None:
+            return r
+        i = bisect.bisect_right(self.bkr_starts, key)
         if i == 0:
             raise Exception('search in empty map')
-        return self.bkrs[i-1]
+        if len(self._route_cache) >= self.ROUTE_CACHE_SIZE:
+            self._route_cache.clear()
+        r = self._route_cache[key] = self.bkrs[i-1]
+        return r
 
     def srv_by_alias(self, alias) -> Srv:
         if str(alias) not in self.srv:
@@ -125,7 +145,7 @@ class Map:
         while v.inAvail():
             node_id = v.getVarInt()
             srv = self.node_masters.get(node_id, Srv.none())
-            self.bkrs.append(Record(bk, srv.host, srv.port, srv.alias))
+            self._append(Record(bk, srv.host, srv.port, srv.alias))
             bk += 1 + v.getMishasFuckingInt()
         assert(bk == 2**32)
 
@@ -52,12 +52,23 @@ class Request:
         self.noreply = False
 
     def dump(self):
-        keyed_body = OStream()
-        if self.key_prepend:
-            keyed_body.putLps(self.key)
-        keyed_body.putBlob(self.data)
+        # the frame is written at once instead of dumping the keyed body into a Packet
+        key = self.key
+        if isinstance(key, str):
+            key = bytes(key, encoding='utf8')
+        data = self.data
+        if isinstance(data, str):
+            data = bytes(data, encoding='utf8')
+        body_len = len(data) + (4 + len(key) if self.key_prepend else 0)
 
-        return Packet(self.msg, self.sync, keyed_body.data).dump()
+        out = OStream()
+        out.putU32(self.msg)
+        out.putU32(body_len)
+        out.putU32(self.sync)
+        if self.key_prepend:
+            out.putLps(key)
+        out.putBlob(data)
+        return out.data
 
     def __repr__(self):
         return '0x{:04X}/{} len {}'.format(self.msg, self.sync, len(self.data))
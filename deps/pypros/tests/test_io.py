@@ -0,0 +1,37 @@
+import pytest
+
+from pypros.IO import IStream, OStream
+
+
+def test_putters_chain_and_read_back():
+    out = OStream().putU8(1).putU16(2).putU32(3).putU64(4).putLps('лпс').putTlv(5, b'tlv').putTlvU32(6, 7)
+    istr = IStream(out.data)
+    assert (istr.getU8(), istr.getU16(), istr.getU32(), istr.getU64()) == (1, 2, 3, 4)
+    assert istr.getLps().data == 'лпс'.encode('utf8')
+    assert (istr.getU32(), istr.getLps().data) == (5, b'tlv')
+    assert (istr.getU32(), istr.getU32(), istr.getU32()) == (6, 4, 7)
+    assert istr.getAll() == b''
+
+
+def test_nested_lps_lengths_and_count():
+    out = OStream().putU32(0xaa)
+    with out.encloseLps() as lps:
+        lps.putU32(1)
+        with lps.encloseCLps() as clps:
+            clps.putLps(b'a').putLps('бв')
+    istr = IStream(out.data)
+    assert istr.getU32() == 0xaa
+    lps = istr.getLps()
+    assert lps.getU32() == 1
+    clps = lps.getLps()
+    assert clps.getU32() == 2
+    assert [clps.getLps().data, clps.getLps().data] == [b'a', 'бв'.encode('utf8')]
+
+
+def test_lps_is_dropped_on_exception():
+    out = OStream().putU32(1)
+    with pytest.raises(ValueError):
+        with out.encloseLps() as lps:
+            lps.putU32(2)
+            raise ValueError()
+    assert out.data == OStream().putU32(1).data
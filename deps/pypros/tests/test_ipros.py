@@ -0,0 +1,66 @@
+import asyncio
+import struct
+
+import pytest
+
+from pypros.ipros import FrameParser, read_packet, read_packets
+from pypros.packet import Packet
+
+PACKETS = [Packet(0x100 + i, i, bytes([i]) * (i * 37 % 300)) for i in range(50)]
+STREAM = b''.join(p.dump() for p in PACKETS)
+
+
+def as_tuples(packets):
+    return [(p.msg, p.sync, p.body) for p in packets]
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def reader(*parts, eof=True):
+    r = asyncio.StreamReader()
+    for part in parts:
+        r.feed_data(part)
+    if eof:
+        r.feed_eof()
+    return r
+
+
+@pytest.mark.parametrize('size', [1, 7, 12, 100, 65536])
+def test_frame_parser_splits_any_chunking(size):
+    parser = FrameParser()
+    packets = []
+    for chunk in chunks(STREAM, size):
+        packets += parser.feed(chunk)
+    assert as_tuples(packets) == as_tuples(PACKETS)
+    assert parser.pending() == 0
+
+
+def test_frame_parser_keeps_incomplete_tail():
+    parser = FrameParser()
+    assert as_tuples(parser.feed(STREAM[:-1])) == as_tuples(PACKETS[:-1])
+    assert parser.pending() == len(PACKETS[-1].dump()) - 1
+    assert as_tuples(parser.feed(STREAM[-1:])) == as_tuples(PACKETS[-1:])
+
+
+def test_read_packets(run):
+    async def collect(r):
+        return [p async for p in read_packets(r)]
+
+    assert as_tuples(run(collect(reader(*chunks(STREAM, 7))))) == as_tuples(PACKETS)
+    with pytest.raises(struct.error):
+        run(collect(reader(STREAM[:-1])))
+
+
+def test_read_packet(run):
+    r = reader(*chunks(STREAM[:len(PACKETS[0].dump())], 5))
+    assert as_tuples([run(read_packet(r))]) == as_tuples(PACKETS[:1])
+    # clean EOF between packets
+    assert run(read_packet(r)) is None
+
+
+@pytest.mark.parametrize('cut', [5, 12 + 1])
+def test_read_packet_truncated(run, cut):
+    with pytest.raises(struct.error):
+        run(read_packet(reader(PACKETS[3].dump()[:cut])))
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+from pypros.alias import Alias
+from pypros.map import Map, Record
+
+ALIAS = Alias('none.a.none')
+
+
+def build_map(buckets):
+    m = Map()
+    step = 2**32 // buckets
+    for i in range(buckets):
+        m.append(Record(i * step, 'host', i, ALIAS))
+    return m
+
+
+def linear_lookup(m, key):
+    return [r for r in m.bkrs if r.bkr_start <= key][-1]
+
+
+def test_srv_by_bkr_matches_linear_lookup():
+    m = build_map(64)
+    rnd = random.Random(1)
+    keys = [0, 1, 2**32 - 1] + [r.bkr_start for r in m.bkrs] + [r.bkr_start - 1 for r in m.bkrs[1:]]
+    keys += [rnd.randrange(2**32) for _ in range(1000)]
+    for key in keys:
+        assert m.srv_by_bkr(key) is linear_lookup(m, key)
+        # the cached answer is the same
+        assert m.srv_by_bkr(key) is linear_lookup(m, key)
+
+
+def test_srv_by_bkr_in_empty_map():
+    with pytest.raises(Exception):
+        Map().srv_by_bkr(0)
+
+
+def test_route_cache_is_bounded():
+    m = build_map(16)
+    m.ROUTE_CACHE_SIZE = 10
+    for key in range(25):
+        m.srv_by_bkr(key)
+        assert len(m._route_cache) <= 10
+
+
+def test_append_drops_cached_routes():
+    m = Map()
+    m.append(Record(0, 'first', 1, ALIAS))
+    assert m.srv_by_bkr(100).host == 'first'
+    m.append(Record(50, 'second', 2, ALIAS))
+    assert m.srv_by_bkr(100).host == 'second'
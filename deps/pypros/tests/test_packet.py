@@ -0,0 +1,37 @@
+from pypros.IO import IStream
+from pypros.ipros import FrameParser, PACKET_HEADER
+from pypros.packet import Packet, Request
+
+
+def parse_one(data):
+    packets = FrameParser().feed(data)
+    assert len(packets) == 1
+    return packets[0]
+
+
+def test_request_non_ascii_str_data_round_trip():
+    request = Request('ключ', 0x1234, 'привет, мир', sync=7)
+    dumped = request.dump()
+    msg, length, sync = PACKET_HEADER.unpack_from(dumped)
+    assert (msg, sync) == (0x1234, 7)
+    assert length == len(dumped) - PACKET_HEADER.size
+
+    body = IStream(parse_one(dumped).body)
+    assert body.getLps().data.decode('utf8') == 'ключ'
+    assert body.getAll().decode('utf8') == 'привет, мир'
+
+
+def test_request_str_and_bytes_data_dump_the_same():
+    text = 'данные'
+    assert Request('k', 1, text, sync=1).dump() == Request(b'k', 1, text.encode('utf8'), sync=1).dump()
+
+
+def test_request_without_key():
+    request = Request('key', 1, 'ё', sync=1)
+    request.key_prepend = False
+    assert parse_one(request.dump()).body == 'ё'.encode('utf8')
+
+
+def test_packet_dump_round_trip():
+    packet = parse_one(Packet(0xff00, 3, b'\x00\x01body').dump())
+    assert (packet.msg, packet.sync, packet.body) == (0xff00, 3, b'\x00\x01body')
@@ -15,7 +15,7 @@ cb_processor = callback.CallbackProcessor()
 
 async def start(bot, event):
     # Получение пользователя
-    user = event.data['from']['userId']
+    user = event.user_id
     inline_keyboard = [
         [{"text": "🤖 Инструкция @metabot", "callbackData": "instruction"}]
     ]
@@ -38,10 +38,10 @@ async def start(bot, event):
 
 
 async def callbacks(bot, event):
-    callback_name = event.data['callbackData']
+    callback_name = event.callback_data
     if callback_name == 'callback_start':
         await bot.answer_callback_query(
-            query_id=event.data['queryId'],
+            query_id=event.query_id,
             text="",
             show_alert=False
         )
@@ -52,19 +52,19 @@ async def callbacks(bot, event):
 
 
 async def message(bot, event):
-    user = event.data['from']['userId']
-    message_id = event.data['msgId']
+    user = event.user_id
+    message_id = event.msg_id
     try:
         # Обработка пересланного сообщения с информацией о боте
-        text = event.data['parts'][0]['payload']['message']['text']
-    except KeyError:
+        text = util.get_fwd_text(event)
+    except (KeyError, IndexError):
         # Если информацию о боте скопировали
-        text = event.data['text']
+        text = event.text
     try:
         secret_bot = util.parse_bot_info(text)
         if 'token' in secret_bot:
             if await util.validate_token(secret_bot['token']):
-                db.replace(USER_SPACE_NAME, (
+                await db.replace(USER_SPACE_NAME, (
                     user,
                     secret_bot['token'], secret_bot['botId'], secret_bot['nick']
                 ))
@@ -101,31 +101,31 @@ async def callbacks_inline(bot, event):
 async def message_inline(bot, event):
     cb_event = await callback.UserEvent.init(bot, event)
     bot_name = bot.name
-    user_id = event.data['from']['userId']
-    text = event.data['text'] if 'text' in event.data else ''
-    is_admin = util.is_admin(user_id, bot_name)
+    user_id = event.user_id
+    text = event.text
+    is_admin = await util.is_admin(user_id, bot_name, cache=cb_event.cache)
 
     if event.from_chat != user_id:
         return
     if not text.startswith("/"):
         if is_admin:
             try:
-                _, _, _, quiz, step, _ = db.select_index(
+                _, _, _, quiz, step, _ = (await db.select_index(
                     ADMIN_SPACE_NAME, (
                         user_id, bot_name
-                    ), index='admin_bot'
-                )[0]
+                    ), index='admin_bot', cache=cb_event.cache
+                ))[0]
                 if quiz:
                     await cb_processor.set_icq_channel(cb_event)
                 elif cb_event.wait_user_for is not None:
                     cb_event.callback_name = cb_event.wait_user_for
                     await cb_processor(cb_event)
-                elif not util.is_bot_active(bot.token):
+                elif not await util.is_bot_active(bot.token, cache=cb_event.cache):
                     await bot.send_text(
                         chat_id=user_id,
                         text="Чтобы публиковать объявления, необходимо включить бота"
                     )
-                elif not util.get_bot_channel(bot_name):
+                elif not await util.get_bot_channel(bot_name, cache=cb_event.cache):
                     await bot.send_text(
                         chat_id=user_id,
                         text="⚠️ Чтобы в группу или канал начали публиковаться объявления,"
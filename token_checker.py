@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import random
+
+from mailru_im_async_bot import stat
+import utilities as util
+
+log = logging.getLogger(__name__)
+
+
+class TokenHealthChecker:
+    """
+    Один планировщик проверки токенов для всех запущенных ботов.
+    Токены проверяются пачками с ограничением частоты и случайной задержкой,
+    токен с ошибкой поллинга проверяется вне очереди
+    """
+
+    def __init__(self, on_invalid, period_s=30, batch_size=20, batch_interval_s=1.0, loop=None):
+        """
+        :param on_invalid: Корутина-функция (token, bot_name), вызывается для недействительного токена
+        :param period_s: Период полной проверки всех токенов
+        :param batch_size: Количество токенов, проверяемых одновременно
+        :param batch_interval_s: Пауза между пачками
+        """
+        self.on_invalid = on_invalid
+        self.period_s = period_s
+        self.batch_size = batch_size
+        self.batch_interval_s = batch_interval_s
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        # token -> bot name
+        self.tokens = {}
+        self._urgent = set()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def register(self, token, bot_name):
+        self.tokens[token] = bot_name
+
+    def unregister(self, token):
+        self.tokens.pop(token, None)
+        self._urgent.discard(token)
+        if not self._urgent:
+            self._wakeup.clear()
+
+    def request_check(self, token):
+        if token in self.tokens:
+            self._urgent.add(token)
+            self._wakeup.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = self.loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                tokens = list(self.tokens)
+                random.shuffle(tokens)
+                for i in range(0, len(tokens), self.batch_size):
+                    await self._check([t for t in tokens[i:i + self.batch_size] if t in self.tokens])
+                    await self._sleep(self.batch_interval_s * random.uniform(0.5, 1.5))
+                await self._sleep(self.period_s * random.uniform(0.9, 1.1))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception(e)
+                await asyncio.sleep(self.batch_interval_s)
+
+    async def _sleep(self, delay):
+        """
+        Ждет delay секунд, но просыпается раньше, если есть токены для внеочередной проверки
+        """
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        # the tokens which set it may have been unregistered since
+        self._wakeup.clear()
+        if self._urgent:
+            tokens = list(self._urgent)
+            self._urgent.clear()
+            for token in tokens:
+                # don't trust a cached validation result for a token polling complained about
+                util.bot_self_cache.invalidate(token)
+            await self._check(tokens)
+
+    async def _check(self, tokens):
+        results = await asyncio.gather(*(util.validate_token(t) for t in tokens), return_exceptions=True)
+        stat('token_check.cnt', len(tokens))
+        for token, result in zip(tokens, results):
+            if isinstance(result, Exception):
+                # network problems are not a reason to drop the bot
+                log.error(f"token check failed: {result!r}")
+            elif not result and token in self.tokens:
+                bot_name = self.tokens.pop(token)
+                log.warning(f"token of @{bot_name} is invalid")
+                stat('token_check.invalid.cnt', 1)
+                await self.on_invalid(token, bot_name)
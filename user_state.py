@@ -0,0 +1,119 @@
+import asyncio
+import logging
+
+from mailru_im_async_bot import stat
+import db
+
+log = logging.getLogger(__name__)
+
+SPACE_NAME = 'wait_user_for'
+
+
+class ConversationState:
+    """
+    Состояние диалога пользователя (wait_user_for) в памяти.
+    Изменения записываются в tarantool в фоне (write-behind),
+    при смене роли на main состояние загружается из спейса заново
+    """
+
+    def __init__(self, flush_interval_s=1.0, loop=None):
+        """
+        :param flush_interval_s: Период записи изменений в tarantool
+        """
+        self.flush_interval_s = flush_interval_s
+        self.loop = asyncio.get_event_loop() if loop is None else loop
+        # user id -> value
+        self._state = {}
+        # user id -> value to write, None means delete
+        self._dirty = {}
+        self._loaded = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """
+        Загружает состояние из спейса и запускает фоновую запись
+        """
+        if self._task is None:
+            self._task = self.loop.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновую запись, сохраняет несохраненные изменения и очищает состояние
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        # wake up pop() calls waiting for a load which will never finish
+        self._loaded.set()
+        await self.flush()
+        self._state.clear()
+        self._loaded.clear()
+
+    def set(self, user_id, value):
+        self._state[user_id] = value
+        self._dirty[user_id] = value
+
+    async def pop(self, user_id):
+        """
+        Возвращает и удаляет состояние пользователя.
+        Пока состояние не загружено, ждет загрузки; если оно остановлено (инстанс не main), сразу возвращает None
+        :param user_id: Id пользователя
+        :return: Значение wait_user_for или None
+        """
+        if self._task is None:
+            return None
+        await self._loaded.wait()
+        if self._task is None:
+            return None
+        value = self._state.pop(user_id, None)
+        if value is not None:
+            self._dirty[user_id] = None
+        return value
+
+    async def load(self):
+        rows = await db.select(SPACE_NAME)
+        # changes made before the load are newer than the stored ones
+        self._state = {**{row[0]: row[1] for row in rows}, **self._state}
+        self._loaded.set()
+        log.info(f"{len(rows)} {SPACE_NAME} states loaded")
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        try:
+            results = await asyncio.gather(*(
+                db.delete(SPACE_NAME, user_id) if value is None else
+                db.upsert(SPACE_NAME, (user_id, value), (('=', 1, value),))
+                for user_id, value in dirty.items()
+            ), return_exceptions=True)
+        except asyncio.CancelledError:
+            # writes are idempotent, so everything is written again by the next flush
+            for user_id, value in dirty.items():
+                self._dirty.setdefault(user_id, value)
+            raise
+        stat(f'{SPACE_NAME}.flush.cnt', len(dirty))
+        for (user_id, value), result in zip(dirty.items(), results):
+            if isinstance(result, Exception):
+                log.error(f"failed to save {SPACE_NAME} of user {user_id}: {result!r}")
+                stat(f'{SPACE_NAME}.flush.error.cnt', 1)
+                # retry with the next flush unless it was changed again
+                self._dirty.setdefault(user_id, value)
+
+    async def _run(self):
+        while not self._loaded.is_set():
+            try:
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception(e)
+                await asyncio.sleep(self.flush_interval_s)
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            try:
+                await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.exception(e)
@@ -1,17 +1,60 @@
 import re
+import asyncio
 import logging
 import aiohttp
 
 import db
+from cache import TTLCache
+from user_state import ConversationState
+from mailru_im_async_bot import stat, measure
 from config import (
     ICQ_API,
+    FAN_OUT_CONCURRENCY,
     BOT_SPACE_NAME,
     ADMIN_SPACE_NAME,
-    INLINE_USER_SETUP_SPACE_NAME
+    INLINE_USER_SETUP_SPACE_NAME,
+    CACHE_TTL_S,
+    CACHE_MAX_LEN,
+    TOKEN_CACHE_TTL_S,
+    WRITE_BEHIND_INTERVAL_S,
+    REQUEST_TIMEOUT_S
 )
 
 log = logging.getLogger(__name__)
 
+# bot nick -> bots tuple
+bot_cache = TTLCache('bots', CACHE_MAX_LEN, CACHE_TTL_S)
+# bot token -> activity flag
+bot_activity_cache = TTLCache('bot_activity', CACHE_MAX_LEN, CACHE_TTL_S)
+# bot nick -> admin uids
+admin_cache = TTLCache('admins', CACHE_MAX_LEN, CACHE_TTL_S)
+# bot token -> /self/get response, only successful validations are stored
+bot_self_cache = TTLCache('bot_self', CACHE_MAX_LEN, TOKEN_CACHE_TTL_S)
+# user id -> wait_user_for, persisted in the background
+wait_user_for_state = ConversationState(WRITE_BEHIND_INTERVAL_S)
+
+# long-lived session for requests made outside of a Bot instance
+_http_session = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=REQUEST_TIMEOUT_S)
+        )
+    return _http_session
+
+
+async def close_http_session():
+    if _http_session is not None:
+        await _http_session.close()
+
+
+def clear_caches():
+    for cache in (bot_cache, bot_activity_cache, admin_cache):
+        cache.clear()
+
 
 def parse_bot_info(text: str) -> dict:
     bot_id = re.search(
@@ -51,30 +94,31 @@ def ltrim(text: str, prefix) -> str:
         return text[len(prefix):]
 
 
-def add_bot_admin(user, bot_nick):
-    db.insert(ADMIN_SPACE_NAME, (
+async def add_bot_admin(user, bot_nick, cache=None):
+    await db.insert(ADMIN_SPACE_NAME, (
         user.user_id, bot_nick, True, '', 0, ''
-    ))
+    ), cache=cache)
+    admin_cache.invalidate(bot_nick)
 
 
-def get_hello_message(bot_nick) -> str:
-    return db.select_index(
-        BOT_SPACE_NAME, bot_nick, index='bot'
-    )[0][-2]
+async def get_hello_message(bot_nick, cache=None) -> str:
+    return (await db.select_index(
+        BOT_SPACE_NAME, bot_nick, index='bot', cache=cache
+    ))[0][-2]
 
 
-def is_admin_active(user_id, bot_nick) -> bool:
-    return db.select_index(
-        ADMIN_SPACE_NAME, (user_id, bot_nick), index='admin_bot'
-    )[0][2]
+async def is_admin_active(user_id, bot_nick, cache=None) -> bool:
+    return (await db.select_index(
+        ADMIN_SPACE_NAME, (user_id, bot_nick), index='admin_bot', cache=cache
+    ))[0][2]
 
 
-def switch_admin_status(user_id, bot_name) -> str:
-    is_active = is_admin_active(
-        user_id, bot_name
+async def switch_admin_status(user_id, bot_name, cache=None) -> str:
+    is_active = await is_admin_active(
+        user_id, bot_name, cache=cache
     )
     try:
-        db.update(ADMIN_SPACE_NAME, (user_id, bot_name), (('=', 2, not is_active),))
+        await db.update(ADMIN_SPACE_NAME, (user_id, bot_name), (('=', 2, not is_active),), cache=cache)
     except IndexError:
         log.error(
             "Ошибка при получении пользовательских настроек"
@@ -83,56 +127,65 @@ def switch_admin_status(user_id, bot_name) -> str:
         return "не активен" if is_admin_active else "активен"
 
 
-def switch_inline_status(token, status: bool = None):
-    bot_data = db.select_index('bot_activity', token, 'bot')
+async def switch_inline_status(token, status: bool = None, cache=None):
+    bot_activity_cache.invalidate(token)
+    bot_data = await db.select_index('bot_activity', token, 'bot', cache=cache)
     if bot_data:
         bot = bot_data[0]
         new_status = status if status is not None else not bot[1]
-        db.update('bot_activity', token, (('=', 1, new_status),))
-        return new_status
+        await db.update('bot_activity', token, (('=', 1, new_status),), cache=cache)
     else:
-        db.insert('bot_activity', (token, True))
-        return True
+        new_status = True
+        await db.insert('bot_activity', (token, True), cache=cache)
+    # a concurrent is_bot_active may have cached the old value during the round-trips
+    bot_activity_cache.invalidate(token)
+    return new_status
 
 
-def is_bot_active(token):
-    bot_data = db.select_index('bot_activity', token, 'bot')
-    return bot_data[0][1] if bot_data else switch_inline_status(token, True)
+async def is_bot_active(token, cache=None):
+    is_active = bot_activity_cache.get(token)
+    if is_active is None:
+        bot_data = await db.select_index('bot_activity', token, 'bot', cache=cache)
+        is_active = bot_data[0][1] if bot_data else await switch_inline_status(token, True, cache=cache)
+        bot_activity_cache.put(token, is_active)
+    return is_active
 
 
-def get_bot_admins(bot_name):
-    data = db.select_index(ADMIN_SPACE_NAME, bot_name, 'bot_nick')
+async def get_bot_admins(bot_name, cache=None):
+    data = await db.select_index(ADMIN_SPACE_NAME, bot_name, 'bot_nick', cache=cache)
     return [x[0] for x in data]
 
 
-def change_index_tuple_admin(user_id, bot_name, kwargs) -> None:
+async def change_index_tuple_admin(user_id, bot_name, kwargs, cache=None) -> None:
     try:
-        admin_settings = db.select_index(
-            ADMIN_SPACE_NAME, (user_id, bot_name), index='admin_bot'
-        )[0]
+        admin_settings = (await db.select_index(
+            ADMIN_SPACE_NAME, (user_id, bot_name), index='admin_bot', cache=cache
+        ))[0]
         for key, value in kwargs.items():
             admin_settings[int(key)] = value
-        db.replace(ADMIN_SPACE_NAME, admin_settings)
+        await db.replace(ADMIN_SPACE_NAME, admin_settings, cache=cache)
+        admin_cache.invalidate(bot_name)
     except IndexError:
         log.error("Невозможно очистить стороннюю информаицю администратора")
 
 
-def set_null_admin_tuple(user_id, bot_name) -> None:
+async def set_null_admin_tuple(user_id, bot_name, cache=None) -> None:
     try:
-        db.update(ADMIN_SPACE_NAME,
-                  (user_id, bot_name),
-                  (
-                      ('=', 3, ''),
-                      ('=', 4, 0),
-                      ("=", 5, '')
-                  ))
+        await db.update(ADMIN_SPACE_NAME,
+                        (user_id, bot_name),
+                        (
+                            ('=', 3, ''),
+                            ('=', 4, 0),
+                            ("=", 5, '')
+                        ),
+                        cache=cache)
     except IndexError:
         log.error("Невозможно очистить сторонную информаицю администратора")
 
 
-def change_anonymous_status(user_id, status) -> None:
+async def change_anonymous_status(user_id, status) -> None:
     try:
-        db.update(INLINE_USER_SETUP_SPACE_NAME, user_id, (('=', 2, status),))
+        await db.update(INLINE_USER_SETUP_SPACE_NAME, user_id, (('=', 2, status),))
     except IndexError:
         log.error("Ошибка при смене статуса анонима пользователя")
     else:
@@ -162,75 +215,127 @@ def extract_username(event_data):
     return event_data['from']['nick'] if 'nick' in event_data['from'] else None
 
 
+async def get_bot_self(token):
+    """
+    Запрашивает /self/get бота
+    :param token: Токен бота
+    :return: Ответ /self/get, если токен действителен, иначе None
+    """
+    if re.match(r"\d{3}\.\d{10}\.\d{10}:\d{9}", token):
+        response_data = bot_self_cache.get(token)
+        if response_data is not None:
+            return response_data
+        async with get_http_session().get(f"{ICQ_API}/self/get", params={'token': token}) as response:
+            response_data = await response.json()
+            if response_data['ok']:
+                bot_self_cache.put(token, response_data)
+                return response_data
+    return None
+
+
 async def validate_token(token) -> bool:
-    is_valid = re.match(r"\d{3}\.\d{10}\.\d{10}:\d{9}", token)
-    if is_valid:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(f"{ICQ_API}/self/get?token={token}") as response:
-                response_data = await response.json()
-                is_active = response_data['ok']
-    return is_valid and is_active
-
-
-def is_admin(user_id, bot_name):
-    return db.exist_index(
-        ADMIN_SPACE_NAME, (
-            user_id, bot_name
-        ), index='admin_bot'
-    )
+    return await get_bot_self(token) is not None
 
 
-def get_admin_uids(bot_name):
-    data = db.select_index(ADMIN_SPACE_NAME, bot_name, index='bot_nick')
-    return [x[0] for x in data]
+async def is_admin(user_id, bot_name, cache=None):
+    return user_id in await get_admin_uids(bot_name, cache=cache)
+
+
+async def get_admin_uids(bot_name, cache=None):
+    admins = admin_cache.get(bot_name)
+    if admins is None:
+        data = await db.select_index(ADMIN_SPACE_NAME, bot_name, index='bot_nick', cache=cache)
+        admins = [x[0] for x in data]
+        admin_cache.put(bot_name, admins)
+    # callers are free to modify the returned list
+    return list(admins)
 
 
-def get_bot_data(bot_name):
-    bot_data = db.select_index(BOT_SPACE_NAME, bot_name, index='bot')
-    return bot_data[0] if len(bot_data) else None
+async def get_bot_data(bot_name, cache=None):
+    bot_data = bot_cache.get(bot_name)
+    if bot_data is None:
+        data = await db.select_index(BOT_SPACE_NAME, bot_name, index='bot', cache=cache)
+        if not len(data):
+            return None
+        bot_data = data[0]
+        bot_cache.put(bot_name, bot_data)
+    # callers are free to modify the returned tuple
+    return list(bot_data)
 
 
-def get_bot_channel(bot_name):
-    bot_data = get_bot_data(bot_name)
+async def get_bot_channel(bot_name, cache=None):
+    bot_data = await get_bot_data(bot_name, cache=cache)
     return bot_data[6] if bot_data is not None and bot_data[6] else None
 
 
-def set_bot_channel(uid, token, channel=''):
-    db.update(BOT_SPACE_NAME, (uid, token), (('=', 6, channel),))
+async def set_bot_channel(uid, token, channel='', cache=None):
+    await db.update(BOT_SPACE_NAME, (uid, token), (('=', 6, channel),), cache=cache)
+    bot_cache.invalidate_where(lambda _, bot_data: bot_data[1] == token)
 
 
 def has_parts(event):
-    return 'parts' in event.data
+    return bool(event.parts)
 
 
 def is_forwarded(event):
-    return has_parts(event) and event.data['parts'][0]['type'] == 'forward'
+    return has_parts(event) and event.parts[0]['type'] == 'forward'
 
 
 def get_fwd_id(event):
-    return event.data['parts'][0]['payload']['message']['msgId']
+    return event.forwards[0]['message']['msgId']
 
 
 def get_fwd_text(event):
-    return event.data['parts'][0]['payload']['message']['text']
+    return event.forwards[0]['message']['text']
 
 
 def get_fwd_chat(event):
-    return event.data['parts'][0]['payload']['message']['chat']['chatId']
+    return event.forwards[0]['message']['chat']['chatId']
 
 
-def is_fwd_from_channel(bot_name, event):
+async def is_fwd_from_channel(bot_name, event, cache=None):
     is_fwd = False
     if is_forwarded(event):
-        message_data = db.select_index('messages', get_fwd_id(event), 'post')
-        icq_channel = get_bot_channel(bot_name)
+        message_data = await db.select_index('messages', get_fwd_id(event), 'post')
+        icq_channel = await get_bot_channel(bot_name, cache=cache)
         if message_data[0][6] == icq_channel:
             is_fwd = True
     return is_fwd
 
 
 def set_wait_user_for(user_id, value):
-    db.upsert('wait_user_for', (user_id, value), (('=', 1, value),))
+    wait_user_for_state.set(user_id, value)
+
+
+async def fan_out(recipients, send, metric, concurrency=FAN_OUT_CONCURRENCY):
+    """
+    Вызывает send(recipient) для всех получателей, не более concurrency одновременно.
+    Ошибка одного получателя не влияет на остальных
+    :param recipients: Список получателей
+    :param send: Корутина-функция отправки одному получателю
+    :param metric: Имя рассылки для статистики
+    :param concurrency: Максимальное количество одновременных отправок
+    :return: Количество неудачных отправок
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_one(recipient):
+        async with semaphore:
+            return await send(recipient)
+
+    with measure(f"fanout.{metric}.time"):
+        results = await asyncio.gather(*(send_one(r) for r in recipients), return_exceptions=True)
+    failed = 0
+    for recipient, result in zip(recipients, results):
+        if isinstance(result, Exception):
+            log.error(f"fan out {metric} to {recipient} failed: {result!r}")
+            failed += 1
+        elif not result or not result.get('ok'):
+            log.error(f"fan out {metric} to {recipient} failed: {result}")
+            failed += 1
+    stat(f"fanout.{metric}.cnt", len(recipients))
+    stat(f"fanout.{metric}.error.cnt", failed)
+    return failed
 
 
 async def is_user_valid(bot, user_id):